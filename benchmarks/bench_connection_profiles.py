@@ -0,0 +1,55 @@
+"""Compares session write latency under each connection profile.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_connection_profiles [writes]
+"""
+from datetime import datetime, timedelta
+import os
+import statistics
+import sys
+import tempfile
+import time
+from dtimetracker.persistence import SQLitePersistence
+
+
+def bench_profile(profile, writes, directory):
+    SQLitePersistence.init_db(
+        os.path.join(directory, f"{profile}.db"), profile)
+    project = SQLitePersistence.create_project("Benchmark")
+
+    start = datetime(2022, 1, 1, 8, 0)
+    latencies = []
+    for i in range(writes):
+        session_start = start + timedelta(hours=i)
+        t0 = time.perf_counter()
+        SQLitePersistence.create_session(
+            project.id, session_start, session_start + timedelta(minutes=45))
+        latencies.append(time.perf_counter() - t0)
+
+    SQLitePersistence.delete_db()
+
+    latencies.sort()
+    return (statistics.median(latencies),
+            latencies[int(len(latencies) * 0.95)],
+            sum(latencies))
+
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    db_name = SQLitePersistence._db_name
+
+    print(f"{writes} create_session calls per profile")
+    print(f"{'profile':<10} {'median ms':>10} {'p95 ms':>10} {'total s':>10}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in SQLitePersistence.connection_profiles:
+            median, p95, total = bench_profile(profile, writes, directory)
+            print(f"{profile:<10} {median * 1000:>10.3f} "
+                  f"{p95 * 1000:>10.3f} {total:>10.3f}")
+
+    SQLitePersistence.configure(db_name)
+
+
+if __name__ == "__main__":
+    main()
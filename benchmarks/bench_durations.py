@@ -0,0 +1,83 @@
+"""Compares summing session durations per object and per batch.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_durations [sizes...]
+
+The batch total uses NumPy when it is installed and pure Python
+otherwise; both are timed when NumPy is available.
+"""
+from datetime import datetime
+import random
+import sys
+import time
+from dtimetracker import core
+from dtimetracker.core import (
+    Project, Session, SessionBatch, from_timestamp, sum_durations,
+    to_timestamp)
+
+
+def make_batch(size):
+    rng = random.Random(size)
+    now = to_timestamp(datetime.now())
+    batch = SessionBatch()
+
+    start = now - size * 3600
+    for i in range(size):
+        start += rng.randrange(600, 3600)
+        end = start + rng.randrange(60, 4 * 3600)
+        if i == size - 1:
+            end = None
+        batch.append(i + 1, start, end, 1)
+
+    return batch
+
+
+def make_sessions(batch):
+    project = Project("Benchmark", id=1)
+    sessions = []
+    for start, end in zip(batch.starts, batch.ends):
+        session = Session(project)
+        session.start = from_timestamp(start)
+        if end != SessionBatch.OPEN:
+            session.end = from_timestamp(end)
+        sessions.append(session)
+    return sessions
+
+
+def timed(function, *args):
+    t0 = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    numpy = core.np
+
+    print(f"{'sessions':>10} {'objects':>10} {'python':>10} {'numpy':>10}")
+    for size in sizes:
+        batch = make_batch(size)
+        sessions = make_sessions(batch)
+        now = to_timestamp(datetime.now())
+
+        _, objects = timed(Session.compute_total_duration, sessions)
+
+        core.np = None
+        python_total, python = timed(
+            sum_durations, batch.starts, batch.ends, now)
+        core.np = numpy
+
+        numpy_time = "-"
+        if numpy is not None:
+            numpy_total, seconds = timed(
+                sum_durations, batch.starts, batch.ends, now)
+            assert numpy_total == python_total
+            numpy_time = f"{seconds * 1000:.1f}ms"
+
+        print(f"{size:>10} {objects * 1000:>8.1f}ms {python * 1000:>8.1f}ms "
+              f"{numpy_time:>10}")
+
+
+if __name__ == "__main__":
+    main()
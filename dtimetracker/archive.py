@@ -0,0 +1,207 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import heapq
+import os
+import struct
+import threading
+from .columns import MappedColumns, write_columns
+from .core import sum_durations
+
+# magic, session count, smallest start, largest start
+HEADER = struct.Struct("<8sQqq")
+MAGIC = b"DTTARCH1"
+
+
+class ArchiveFile:
+    """A read-only, memory-mapped file of archived sessions.
+
+    After the header come four little-endian int64 columns of equal
+    length: ids, project ids, starts and ends, sorted by (project_id,
+    start). The columns are used in place through memoryviews, so opening
+    a file reads nothing but its header, and a project's sessions in a
+    range are found with bisect.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = MappedColumns(path, HEADER, MAGIC)
+
+        _, self.count, self.min_start, self.max_start = self._file.header
+        self.ids, self.project_ids, self.starts, self.ends = (
+            self._file.get_columns(*[self.count] * 4))
+
+    @classmethod
+    def write(cls, path, rows):
+        """Writes (id, start, end, project_id) rows, which must be closed
+        sessions sorted by (project_id, start), to a new file at path.
+        Raises FileExistsError rather than replace an existing file.
+
+        Returns the header as (count, min_start, max_start).
+        """
+        ids = array("q")
+        project_ids = array("q")
+        starts = array("q")
+        ends = array("q")
+        for id, start, end, project_id in rows:
+            ids.append(id)
+            starts.append(start)
+            ends.append(end)
+            project_ids.append(project_id)
+
+        count = len(ids)
+        min_start = min(starts, default=0)
+        max_start = max(starts, default=0)
+
+        write_columns(
+            path, HEADER.pack(MAGIC, count, min_start, max_start),
+            (ids, project_ids, starts, ends), exclusive=True)
+
+        return (count, min_start, max_start)
+
+    def overlaps(self, lo, hi):
+        return self.count > 0 and self.min_start <= hi and self.max_start >= lo
+
+    def _span(self, project_id, lo, hi):
+        """Returns the index range of the project's sessions starting in
+        [lo, hi]."""
+        first = bisect_left(self.project_ids, project_id)
+        last = bisect_right(self.project_ids, project_id, first)
+        i = bisect_left(self.starts, lo, first, last)
+        j = bisect_right(self.starts, hi, i, last)
+        return (i, j)
+
+    def get_project_ids(self):
+        """Returns the ids of the projects with sessions in the file."""
+        project_ids = []
+        i = 0
+        while i < self.count:
+            project_ids.append(self.project_ids[i])
+            i = bisect_right(self.project_ids, project_ids[-1], i)
+        return project_ids
+
+    def count_range(self, project_id, lo, hi):
+        i, j = self._span(project_id, lo, hi)
+        return j - i
+
+    def get_rows(self, project_id, lo, hi):
+        """Returns (id, start, end, project_id) rows like the sessions
+        table does."""
+        return list(self.iter_range(project_id, lo, hi))
+
+    def iter_range(self, project_id, lo, hi):
+        """Yields the rows of get_rows() one at a time."""
+        i, j = self._span(project_id, lo, hi)
+        for k in range(i, j):
+            yield (self.ids[k], self.starts[k], self.ends[k], project_id)
+
+    def get_total(self, project_id, lo, hi):
+        i, j = self._span(project_id, lo, hi)
+        if i == j:
+            return 0
+        return sum_durations(self.starts[i:j], self.ends[i:j])
+
+    def has_session(self, session_id):
+        # Ids aren't sorted, but this only runs when a session is written
+        return session_id in self.ids
+
+    def iter_rows(self):
+        """Yields every (project_id, start, end) in the file."""
+        return zip(self.project_ids, self.starts, self.ends)
+
+    def close(self):
+        self._file.close()
+
+
+class SessionArchive:
+    """The archive files of one database, kept open while in use.
+
+    Which files belong to the archive is recorded by the database
+    (see SQLitePersistence.archive_sessions); open() is told their names.
+    Range reads only look at files whose start range overlaps.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def open(self, names):
+        """Opens the named files, closing any others."""
+        with self._lock:
+            for name in set(self._files) - set(names):
+                self._files.pop(name).close()
+            for name in names:
+                if name not in self._files:
+                    self._files[name] = ArchiveFile(
+                        os.path.join(self.directory, name))
+
+    def add(self, name):
+        with self._lock:
+            self._files[name] = ArchiveFile(
+                os.path.join(self.directory, name))
+
+    def get_files(self):
+        with self._lock:
+            return list(self._files.values())
+
+    def get_overlapping(self, lo, hi):
+        return [f for f in self.get_files() if f.overlaps(lo, hi)]
+
+    def get_rows(self, project_id, lo, hi):
+        """Returns the archived rows in the range, ordered by (start, id)."""
+        rows = []
+        for file in self.get_overlapping(lo, hi):
+            rows.extend(file.get_rows(project_id, lo, hi))
+        rows.sort(key=lambda row: (row[1], row[0]))
+        return rows
+
+    def iter_rows(self, project_id, lo, hi):
+        """Yields the rows of get_rows() one at a time, without building
+        a list of them."""
+        return heapq.merge(
+            *[file.iter_range(project_id, lo, hi)
+              for file in self.get_overlapping(lo, hi)],
+            key=lambda row: (row[1], row[0]))
+
+    def get_project_ids(self):
+        project_ids = set()
+        for file in self.get_files():
+            project_ids.update(file.get_project_ids())
+        return project_ids
+
+    def count(self, project_id, lo, hi):
+        return sum(file.count_range(project_id, lo, hi)
+                   for file in self.get_overlapping(lo, hi))
+
+    def get_total(self, project_id, lo, hi):
+        return sum(file.get_total(project_id, lo, hi)
+                   for file in self.get_overlapping(lo, hi))
+
+    def has_session(self, session_id):
+        return any(file.has_session(session_id) for file in self.get_files())
+
+    def write(self, name, rows):
+        """Writes a new file; it isn't read until add()ed."""
+        os.makedirs(self.directory, exist_ok=True)
+        return ArchiveFile.write(os.path.join(self.directory, name), rows)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def discard(self, name):
+        """Removes a written file that never made it into the archive.
+
+        Files that are part of the archive are never removed.
+        """
+        with self._lock:
+            if name in self._files:
+                return
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def close(self):
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files = {}
@@ -0,0 +1,258 @@
+from collections import OrderedDict
+import threading
+from .core import Project
+
+
+class ProjectCatalogue:
+    """In-process copy of the projects table, indexed by id and by name.
+
+    The persistence layer loads it on first use and patches it on every
+    project write. version goes up with each change, so views can tell
+    whether their project menus are stale without querying anything.
+
+    The projects table's own version counter, stored_version, is checked
+    on every use: if another process wrote projects, the catalogue is
+    reloaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_name = {}
+        self.version = 0
+        self.stored_version = None
+
+    def is_loaded(self):
+        return self._by_id is not None
+
+    def load(self, projects, version, stored_version):
+        """Installs projects read while the catalogue was at version and
+        the table at stored_version.
+
+        Ignored if a write happened in the meantime, since the projects
+        may then already be outdated.
+        """
+        with self._lock:
+            if version != self.version:
+                return
+
+            self._by_id = {}
+            self._by_name = {}
+            for project in projects:
+                self._by_id[project.id] = project.name
+                self._by_name[project.name] = project.id
+            self.stored_version = stored_version
+
+    def check_stored_version(self, stored_version):
+        """Drops the catalogue if the table moved on without it."""
+        with self._lock:
+            if self._by_id is None \
+                    or stored_version == self.stored_version:
+                return
+            self._unload()
+
+    def invalidate(self):
+        with self._lock:
+            self._unload()
+
+    def _unload(self):
+        self._by_id = None
+        self._by_name = {}
+        self.stored_version = None
+        self.version += 1
+
+    def _advance(self, stored_version):
+        # Our own write is patched in if it directly follows what the
+        # catalogue holds; otherwise other writes came between and it is
+        # reloaded
+        self.version += 1
+        if self._by_id is None:
+            return False
+        if stored_version != self.stored_version + 1:
+            self._unload()
+            return False
+        self.stored_version = stored_version
+        return True
+
+    def put(self, project, stored_version):
+        """Adds a project, or renames it if its id is already known."""
+        with self._lock:
+            if not self._advance(stored_version):
+                return
+
+            old_name = self._by_id.get(project.id)
+            if old_name is not None:
+                del self._by_name[old_name]
+            self._by_id[project.id] = project.name
+            self._by_name[project.name] = project.id
+
+    def remove(self, project_id, stored_version):
+        with self._lock:
+            if not self._advance(stored_version):
+                return
+
+            name = self._by_id.pop(project_id, None)
+            if name is not None:
+                del self._by_name[name]
+
+    # Projects are handed out as fresh objects so callers can't change
+    # the cached copy
+    def get_all(self):
+        with self._lock:
+            return [Project(name=name, id=id)
+                    for id, name in self._by_id.items()]
+
+    def get_names(self):
+        with self._lock:
+            return list(self._by_id.values())
+
+    def get(self, project_id):
+        with self._lock:
+            name = self._by_id.get(project_id)
+        if name is None:
+            return None
+        return Project(name=name, id=project_id)
+
+    def get_by_name(self, project_name):
+        with self._lock:
+            project_id = self._by_name.get(project_name)
+        if project_id is None:
+            return None
+        return Project(name=project_name, id=project_id)
+
+
+class RangeCache:
+    """A bounded LRU cache of per-project range query results.
+
+    Every entry remembers the project and the [lo, hi] epoch range it
+    was computed from. A session write only drops the entries of its
+    project whose range holds the session's old or new start.
+
+    The cache holds at most max_entries entries and max_rows rows in
+    total, where each entry's size in rows is given to put(). A result
+    larger than max_rows on its own, like years of sessions, is not
+    cached at all.
+
+    Entries hold as of session_version. Readers pass the database's
+    current one to check_version() before each lookup, which clears the
+    cache if other processes wrote sessions; this process's writes
+    advance() it after invalidating what they touched.
+    """
+
+    def __init__(self, max_entries=256, max_rows=50000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_project = {}
+        self._rows = 0
+        self.generation = 0
+        self.session_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def check_version(self, session_version):
+        with self._lock:
+            if session_version != self.session_version:
+                self._clear()
+                self.session_version = session_version
+
+    def advance(self, session_version):
+        """Moves on to the version of a write this process made, unless
+        writes it didn't make came in between."""
+        with self._lock:
+            if self.session_version == session_version - 1:
+                self.session_version = session_version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key, project_id, lo, hi, value, generation, rows=1):
+        """Stores a value of the given number of rows, computed while the
+        cache was at generation.
+
+        Ignored if a write invalidated anything in the meantime, since
+        the value may already be outdated.
+        """
+        with self._lock:
+            if generation != self.generation or rows > self.max_rows:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (project_id, lo, hi, value, rows)
+            self._keys_by_project.setdefault(project_id, set()).add(key)
+            self._rows += rows
+
+            while (len(self._entries) > self.max_entries
+                    or self._rows > self.max_rows):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._keys_by_project[entry[0]].discard(key)
+        self._rows -= entry[4]
+
+    def invalidate(self, project_id, intervals):
+        """Drops the project's entries overlapping any (start, end)."""
+        with self._lock:
+            self.generation += 1
+
+            keys = self._keys_by_project.get(project_id, set())
+            for key in list(keys):
+                _, lo, hi, _, _ = self._entries[key]
+                for start, end in intervals:
+                    if start <= hi and end >= lo:
+                        self._remove(key)
+                        self.invalidations += 1
+                        break
+
+    def invalidate_project(self, project_id):
+        with self._lock:
+            self.generation += 1
+
+            for key in list(self._keys_by_project.get(project_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.session_version = None
+
+    def _clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._keys_by_project.clear()
+        self._rows = 0
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "rows": self._rows,
+            }
@@ -0,0 +1,89 @@
+from array import array
+import mmap
+import os
+import sys
+
+
+def write_columns(path, header, columns, exclusive=False):
+    """Writes a header followed by int64 columns to a new file at path.
+
+    Columns are arrays of type "q", stored little-endian. The file is
+    written under a temporary name and only renamed once it is complete
+    and on disk, so readers never see a partial file.
+
+    With exclusive, FileExistsError is raised instead of replacing a file
+    already at path. The file is then written in place, for callers that
+    only start reading it once it is recorded elsewhere.
+    """
+    if exclusive:
+        file = open(path, "xb")
+        try:
+            with file:
+                _write_to(file, header, columns)
+        except BaseException:
+            os.remove(path)
+            raise
+        return
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        _write_to(file, header, columns)
+    os.replace(tmp_path, path)
+
+
+def _write_to(file, header, columns):
+    file.write(header)
+    for column in columns:
+        if sys.byteorder != "little":
+            column = array("q", column)
+            column.byteswap()
+        column.tofile(file)
+    file.flush()
+    os.fsync(file.fileno())
+
+
+class MappedColumns:
+    """A file written by write_columns, memory-mapped read-only.
+
+    get_columns() hands out the int64 columns as memoryviews into the
+    map, so nothing is read until it is used.
+    """
+
+    def __init__(self, path, header_struct, magic):
+        self.path = path
+
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.header = header_struct.unpack_from(self._mmap)
+        if self.header[0] != magic:
+            self._mmap.close()
+            raise ValueError(f"Unexpected file format: {path}")
+
+        self._offset = header_struct.size
+        self._views = [memoryview(self._mmap)]
+
+    def get_columns(self, *lengths):
+        """Returns the next columns, one per number of items given."""
+        columns = []
+        for length in lengths:
+            end = self._offset + 8 * length
+            column = self._views[0][self._offset:end]
+            self._views.append(column)
+            self._offset = end
+
+            if sys.byteorder == "little":
+                column = column.cast("q")
+                self._views.append(column)
+            else:
+                column = array("q", column.tobytes())
+                column.byteswap()
+            columns.append(column)
+        return columns
+
+    def close(self):
+        # Views must go before the map they point into
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
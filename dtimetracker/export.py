@@ -0,0 +1,58 @@
+import csv
+from itertools import islice
+from .persistence import SQLitePersistence
+
+
+class SessionExporter:
+    """Streams sessions out of SQLite into CSV or TSV files."""
+
+    formats = {
+        "csv": "excel",
+        "tsv": "excel-tab",
+    }
+
+    header = ("id", "project", "start", "end", "seconds")
+
+    @classmethod
+    def export(cls, file, project_ids=None, from_=None, to=None,
+               status=None, format="csv", progress=None,
+               progress_every=10000):
+        """Writes the matching sessions to an open text file.
+
+        The filters are those of SQLitePersistence.iter_session_records.
+        progress(done, total) is called after every progress_every rows
+        and after the last one; it runs on the exporting thread. Returns
+        the number of sessions written.
+        """
+        if format not in SessionExporter.formats:
+            raise ValueError(f"Unknown export format: {format}")
+
+        total = None
+        if progress is not None:
+            total = SQLitePersistence.count_sessions(
+                project_ids, from_, to, status)
+
+        writer = csv.writer(file, dialect=SessionExporter.formats[format])
+        writer.writerow(SessionExporter.header)
+
+        records = SQLitePersistence.iter_session_records(
+            project_ids, from_, to, status)
+
+        # Rows are written a chunk at a time, which keeps the loop in C
+        # while still bounding memory use
+        done = 0
+        while chunk := list(islice(records, progress_every)):
+            writer.writerows(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+        if progress is not None and done == 0:
+            progress(0, total)
+        return done
+
+    @classmethod
+    def export_to_path(cls, path, *args, **kwargs):
+        # csv needs newline="" to write its own line endings
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            return SessionExporter.export(file, *args, **kwargs)
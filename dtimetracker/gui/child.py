@@ -5,6 +5,7 @@ from tkinter import ttk
 class ChildWindow(tk.Toplevel):
     def __init__(self, root):
         super().__init__(root)
+        self.executor = root.executor
         self.transient(root)
         self.grab_set()
         # self.configure(bg='#33393B')
@@ -0,0 +1,11 @@
+def keyed_diff(old, new):
+    """Compares two {key: value} row sets.
+
+    Returns (added, removed, changed) lists of keys, so a view only has to
+    touch the widgets of rows that actually differ.
+    """
+    added = [key for key in new if key not in old]
+    removed = [key for key in old if key not in new]
+    changed = [key for key in new if key in old and old[key] != new[key]]
+
+    return (added, removed, changed)
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+import queue
+
+
+class BackgroundExecutor:
+    """Runs persistence calls on worker threads so Tk never blocks.
+
+    Workers never touch Tk: finished calls are queued and their callbacks
+    run on the Tk thread by a poll loop scheduled with root.after(), which
+    only runs while calls are outstanding.
+
+    Calls submitted with a key replace the previous call with that key.
+    If the older call hasn't started it is cancelled, otherwise its result
+    is dropped, so quickly switching project or scope only ever shows the
+    newest query.
+
+    Writes go to a single worker of their own through submit_write(), so
+    they commit one after the other in the order they were clicked, and
+    are never cancelled.
+    """
+
+    def __init__(self, root, max_workers=2, poll_interval=15):
+        self.root = root
+        self.poll_interval = poll_interval
+
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="dtimetracker-db")
+        self._writer = ThreadPoolExecutor(
+            1, thread_name_prefix="dtimetracker-write")
+        self._done = queue.SimpleQueue()
+        self._latest = {}
+        self._outstanding = 0
+        self._poll_id = None
+
+    def submit(self, function, *args, callback=None, errback=None,
+               key=None):
+        """Runs function(*args) on a worker thread.
+
+        callback(result) or errback(exception) is then called on the Tk
+        thread. Without an errback, exceptions are reported the way Tk
+        reports exceptions in its own callbacks.
+        """
+        if key is not None:
+            self.cancel(key)
+
+        future = self._executor.submit(function, *args)
+        if key is not None:
+            self._latest[key] = future
+
+        self._track(future, key, callback, errback)
+        return future
+
+    def submit_write(self, function, *args, callback=None, errback=None):
+        """Runs function(*args) on the write worker, after every write
+        submitted before it. Callbacks work like in submit()."""
+        future = self._writer.submit(function, *args)
+        self._track(future, None, callback, errback)
+        return future
+
+    def _track(self, future, key, callback, errback):
+        self._outstanding += 1
+        future.add_done_callback(
+            lambda f: self._done.put((f, key, callback, errback)))
+        self._schedule_poll()
+
+    def cancel(self, key):
+        """Drops the pending call with this key, if there is one."""
+        stale = self._latest.pop(key, None)
+        if stale is not None:
+            stale.cancel()
+
+    def shutdown(self):
+        for key in list(self._latest):
+            self.cancel(key)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Clicks must not be lost, so queued writes still commit
+        self._writer.shutdown(wait=True)
+
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+
+        finished = []
+        while True:
+            try:
+                finished.append(self._done.get_nowait())
+            except queue.Empty:
+                break
+
+        self._outstanding -= len(finished)
+        if self._outstanding:
+            self._schedule_poll()
+
+        for future, key, callback, errback in finished:
+            self._deliver(future, key, callback, errback)
+
+    def _deliver(self, future, key, callback, errback):
+        if future.cancelled():
+            return
+
+        if key is not None:
+            if self._latest.get(key) is not future:
+                return
+            del self._latest[key]
+
+        exception = future.exception()
+        if exception is None:
+            if callback is not None:
+                callback(future.result())
+        elif errback is not None:
+            errback(exception)
+        else:
+            self.root.report_callback_exception(
+                type(exception), exception, exception.__traceback__)
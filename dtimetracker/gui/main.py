@@ -1,12 +1,16 @@
 import tkinter as tk
 from tkinter import ttk
-from dtimetracker.core import Session
 from .sessions import SessionsWindow
 from .projects import ProjectsWindow
 from .reports import ReportsWindow
+from .executor import BackgroundExecutor
+from .scheduler import RefreshScheduler
 from datetime import datetime, timedelta, date
 from os.path import dirname, join
+from dtimetracker.core import Duration, to_timestamp
+from dtimetracker.interval_index import IntervalIndex
 from dtimetracker.persistence import SQLitePersistence
+from dtimetracker.snapshot import SessionSnapshot
 
 
 class App(tk.Tk):
@@ -79,11 +83,51 @@ class App(tk.Tk):
         # vars
         self.is_tracking = tk.BooleanVar(self, value=False)
         self.selected_project = None
+        self.open_session = None
+        self.project_menu_version = None
+
+        # totals as last read from the index, see show_session_summaries()
+        self.summary_windows = None
+        self.summary_totals = None
+        self.summary_time = None
+        self.summary_date = None
+
+        # SQLite runs on worker threads, results come back via after()
+        self.executor = BackgroundExecutor(self)
+        self.protocol("WM_DELETE_WINDOW", self.clicked_close)
+
+        # Range totals of the projects looked at, kept current on every
+        # session write
+        self.interval_index = IntervalIndex()
+        self.interval_index.attach()
+
+        # Totals of sessions by their start, read from memory-mapped files.
+        # A snapshot left current by the last run opens at once; otherwise
+        # it is rebuilt in the background.
+        self.snapshot = SessionSnapshot()
+        self.executor.submit(self.snapshot.attach)
+
+        # The running session ticks in memory every second; the index is
+        # only asked again when something invalidates the totals
+        self.scheduler = RefreshScheduler(self)
+        self.scheduler.add_refresher(
+            "projects", self.update_project_option_menu)
+        self.scheduler.add_refresher(
+            "summaries", self.update_session_summaries)
+        self.scheduler.on_tick(self.tick)
+        self.scheduler.start()
 
         self.init_widgets()
         self.set_project_optionmenu_default()
         self.populate_project_optionmenu()
 
+    def clicked_close(self):
+        self.scheduler.stop()
+        self.executor.shutdown()
+        self.interval_index.detach()
+        self.snapshot.close()
+        self.destroy()
+
     def set_theme(self, theme):
         project_root = dirname(dirname(__file__))
         theme_path = join(project_root, 'awthemes-10.4.0')
@@ -104,6 +148,7 @@ class App(tk.Tk):
             self.clicked_project(project_names[0])
 
     def populate_project_optionmenu(self):
+        self.project_menu_version = SQLitePersistence.get_projects_version()
         project_names = SQLitePersistence.get_project_names()
 
         if not project_names:
@@ -114,40 +159,41 @@ class App(tk.Tk):
                 label=project_name,
                 command=lambda n=project_name: self.clicked_project(n))
 
-    def _get_total_duration_string(self, start, end):
-        sessions = SQLitePersistence.get_sessions(
-            self.selected_project.id, start, end)
-        total_time = Session.compute_total_duration(sessions)
-
-        hours_str = str(total_time[0]).zfill(2)
-        minutes_str = str(total_time[1]).zfill(2)
-        time_str = f"{hours_str}:{minutes_str}"
-
-        return time_str
+    def _get_duration_string(self, total_seconds):
+        return str(Duration(total_seconds))
 
     def clicked_project(self, project_name):
         self.project_selector_var.set(project_name)
-        self.selected_project = SQLitePersistence.get_project_by_name(
-            self.project_selector_var.get())
-
-        open_session = SQLitePersistence.get_open_session(
-            self.selected_project.id)
-        if open_session:
-            self.is_tracking.set(True)
-        else:
-            self.is_tracking.set(False)
-
+        self.executor.submit(
+            self._load_project, project_name,
+            callback=self.show_project,
+            key=(self, "project"))
+
+    @staticmethod
+    def _load_project(project_name):
+        # Runs on a worker thread
+        project = SQLitePersistence.get_project_by_name(project_name)
+        open_session = SQLitePersistence.get_open_session(project.id)
+        return (project, open_session)
+
+    def show_project(self, result):
+        self.selected_project, self.open_session = result
+        self.is_tracking.set(self.open_session is not None)
         self.update()
 
     def update(self, *args):
         if self.selected_project is None:
             return
 
-        self.update_project_option_menu()
-        self.update_session_summaries()
         self.update_track_status()
+        self.scheduler.invalidate("projects", "summaries")
 
     def update_project_option_menu(self):
+        # projects haven't changed since the menu was built
+        if (self.project_menu_version
+                == SQLitePersistence.get_projects_version()):
+            return
+
         # delete options in optionmenu
         self.project_menu.delete(0, 'end')
 
@@ -159,44 +205,124 @@ class App(tk.Tk):
         self.populate_project_optionmenu()
 
     def clicked_toggle_button(self):
-        if self.is_tracking.get():
-            session = SQLitePersistence.get_open_session(
-                self.selected_project.id)
-            session.stop()
-            SQLitePersistence.update_session(session)
-        else:
-            SQLitePersistence.create_session(self.selected_project.id)
-
+        # The button flips at once; the session is written in the
+        # background and the totals reread once it is
         new_status = not self.is_tracking.get()
         self.is_tracking.set(new_status)
-
+        self.open_session = None
         self.update_track_status()
 
+        project_id = self.selected_project.id
+        self.executor.submit_write(
+            self._toggle_session, project_id, new_status,
+            callback=lambda session: self.toggled_session(
+                project_id, session))
+
+    @staticmethod
+    def _toggle_session(project_id, start):
+        # Runs on the write worker, after the clicks before this one
+        if start:
+            return SQLitePersistence.create_session(project_id)
+
+        session = SQLitePersistence.get_open_session(project_id)
+        if session is not None:
+            session.stop()
+            SQLitePersistence.update_session(session)
+        return None
+
+    def toggled_session(self, project_id, open_session):
+        if (self.selected_project is not None
+                and self.selected_project.id == project_id
+                and self.is_tracking.get() == (open_session is not None)):
+            self.open_session = open_session
+            self.update_track_status()
+        self.scheduler.invalidate("summaries")
+
     def update_track_status(self):
         if self.is_tracking.get():
             self.toggle_button_text_var.set("Stop")
-            self.indicator_text_var.set("Tracking")
+            elapsed = ""
+            if self.open_session is not None:
+                elapsed = f" ({self.open_session.duration()})"
+            self.indicator_text_var.set("Tracking" + elapsed)
         else:
             self.toggle_button_text_var.set("Start")
             self.indicator_text_var.set("Not tracking")
 
-    def update_session_summaries(self):
-        # update_today
-        start = datetime.now().replace(
+    def get_summary_windows(self):
+        # today
+        today_start = datetime.now().replace(
             hour=0, minute=0, second=0, microsecond=0)
-        end = start.replace(hour=23, minute=59, second=59)
-        time_str = self._get_total_duration_string(start, end)
-        self.today_time_var.set(time_str)
-
-        # update_week)
-        start = date.today() - timedelta(days=date.today().weekday())
-        end = datetime.now().replace(hour=23, minute=59, second=59)
-        time_str = self._get_total_duration_string(start, end)
-        self.week_time_var.set(time_str)
-
-        # update_moth)
-        start = datetime.now().replace(
+        today_end = today_start.replace(hour=23, minute=59, second=59)
+
+        # this week
+        week_start = date.today() - timedelta(days=date.today().weekday())
+        week_end = datetime.now().replace(hour=23, minute=59, second=59)
+
+        # this month
+        month_start = datetime.now().replace(
             day=1, hour=0, minute=0, second=0, microsecond=0)
-        end = datetime.now()
-        time_str = self._get_total_duration_string(start, end)
-        self.month_time_var.set(time_str)
+        month_end = datetime.now().replace(hour=23, minute=59, second=59)
+
+        return [
+            ("today", today_start, today_end),
+            ("week", week_start, week_end),
+            ("month", month_start, month_end),
+        ]
+
+    def update_session_summaries(self):
+        if self.selected_project is None:
+            return
+
+        windows = self.get_summary_windows()
+        self.executor.submit(
+            self._load_summaries, self.selected_project.id, windows,
+            callback=lambda result: self.show_session_summaries(
+                windows, *result),
+            key=(self, "summaries"))
+
+    def _load_summaries(self, project_id, windows):
+        # Runs on a worker thread. The totals are as of now, however long
+        # loading the project takes, since show_live_summaries() adds the
+        # running session's time from then on.
+        now = to_timestamp(datetime.now())
+        return (self.interval_index.get_total_durations(
+                    project_id, windows, now),
+                now)
+
+    def show_session_summaries(self, windows, totals, now):
+        self.summary_windows = windows
+        self.summary_totals = totals
+        self.summary_time = now
+        self.summary_date = date.today()
+        self.show_live_summaries()
+
+    def tick(self):
+        if self.summary_totals is None:
+            return
+
+        # today, this week and this month start somewhere else now
+        if date.today() != self.summary_date:
+            self.scheduler.invalidate("summaries")
+
+        self.show_live_summaries()
+        self.update_track_status()
+
+    def show_live_summaries(self):
+        """Shows the loaded totals plus what the running session has
+        logged since they were read, without querying again."""
+        totals = dict(self.summary_totals)
+
+        if self.open_session is not None:
+            start = max(self.summary_time,
+                        to_timestamp(self.open_session.start))
+            now = to_timestamp(datetime.now())
+
+            # Totals count the time spent inside each window
+            for name, from_, to in self.summary_windows:
+                lo, hi = to_timestamp(from_), to_timestamp(to)
+                totals[name] += max(min(now, hi) - max(start, lo), 0)
+
+        self.today_time_var.set(self._get_duration_string(totals["today"]))
+        self.week_time_var.set(self._get_duration_string(totals["week"]))
+        self.month_time_var.set(self._get_duration_string(totals["month"]))
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from dtimetracker.persistence import SQLitePersistence
 from .child import ChildWindow
+from .diff import keyed_diff
 
 
 class ProjectsWindow(ChildWindow):
@@ -21,53 +22,104 @@ class ProjectsWindow(ChildWindow):
         self.update()
 
     def update(self):
+        self.executor.submit(
+            self._load_projects,
+            callback=self.show_projects,
+            key=(self, "projects"))
+
+    @staticmethod
+    def _load_projects():
+        # Runs on a worker thread
         projects = SQLitePersistence.get_projects()
+        tracking = SQLitePersistence.get_tracking_project_ids()
+        return [(project, project.id in tracking) for project in projects]
 
-        # Delete project rows
-        if self.project_row_dict:
-            for key in self.project_row_dict:
-                self.project_row_dict[key].destroy()
-
-        if not projects:
+    def show_projects(self, projects):
+        if not self.winfo_exists():
             return
 
-        # populate rows
-        self.project_row_dict = {}
-        for project in projects:
-            row_num = len(self.project_row_dict)
-            self.project_row_dict[project.id] = ProjectRow(
-                self.subframe, self, row_num, project)
+        old_rows = {
+            project_id: row.shown
+            for project_id, row in self.project_row_dict.items()
+        }
+        new_rows = {
+            project.id: (project, is_tracking)
+            for project, is_tracking in projects
+        }
+        added, removed, changed = keyed_diff(
+            old_rows,
+            {project_id: (project.name, is_tracking)
+             for project_id, (project, is_tracking) in new_rows.items()})
+
+        # Only rows that differ are touched
+        for project_id in removed:
+            self.project_row_dict.pop(project_id).destroy()
+
+        for project_id in added:
+            self.project_row_dict[project_id] = ProjectRow(
+                self.subframe, self, new_rows[project_id][0])
+
+        for project_id in added + changed:
+            self.project_row_dict[project_id].show(*new_rows[project_id])
+
+        # Rows sit at their place in the list; only those that moved are
+        # gridded again
+        for row_number, (project, _) in enumerate(projects):
+            self.project_row_dict[project.id].move_to(row_number)
+
+    def remove_project(self, project):
+        row = self.project_row_dict.pop(project.id, None)
+        if row is not None:
+            row.destroy()
 
 
 class ProjectRow():
-    def __init__(self, root, toplevel, row_number, project):
+    def __init__(self, root, toplevel, project):
         self.toplevel = toplevel
+        self.project = project
+        self.shown = None
+        # Gridded by move_to()
+        self.row_number = None
         # Project row
         #   project name
-        self.project_name_label = ttk.Label(root, text=project.name)
-        self.project_name_label.grid(column=0, row=row_number, padx=5, pady=5)
+        self.project_name_label = ttk.Label(root)
 
         # project status
-        if SQLitePersistence.get_open_session(project.id):
-            label_text = "Tracking"
-        else:
-            label_text = "Stopped"
-
-        self.project_status_label = ttk.Label(root, text=label_text)
-        self.project_status_label.grid(
-            column=1, row=row_number, padx=5, pady=5)
+        self.project_status_label = ttk.Label(root)
 
         #   rename project
         self.rename_project_button = ttk.Button(
             root, text="Rename", command=lambda: RenameProjectWindow(self))
-        self.rename_project_button.grid(
-            column=2, row=row_number, padx=5, pady=5)
 
         #   delete project
         self.delete_project_button = ttk.Button(
-            root, text="Delete", command=lambda: self.delete_project(project))
-        self.delete_project_button.grid(
-            column=3, row=row_number, padx=5, pady=5)
+            root, text="Delete",
+            command=lambda: self.delete_project(self.project))
+
+    def move_to(self, row_number):
+        if row_number == self.row_number:
+            return
+
+        for column, widget in enumerate((
+                self.project_name_label,
+                self.project_status_label,
+                self.rename_project_button,
+                self.delete_project_button)):
+            widget.grid(column=column, row=row_number, padx=5, pady=5)
+        self.row_number = row_number
+
+    def show(self, project, is_tracking):
+        self.project = project
+
+        if is_tracking:
+            label_text = "Tracking"
+        else:
+            label_text = "Stopped"
+
+        self.project_name_label.config(text=project.name)
+        self.project_status_label.config(text=label_text)
+
+        self.shown = (project.name, is_tracking)
 
     def destroy(self):
         self.project_name_label.destroy()
@@ -83,8 +135,9 @@ class ProjectRow():
             icon='warning')
 
         if answer:
-            SQLitePersistence.delete_project(project)
-            self.toplevel.update()
+            self.toplevel.remove_project(project)
+            self.toplevel.executor.submit_write(
+                SQLitePersistence.delete_project, project)
 
 
 class NewProjectWindow(ChildWindow):
@@ -105,10 +158,11 @@ class NewProjectWindow(ChildWindow):
 
     def new_project(self):
         name = self.project_name.get()
-        SQLitePersistence.create_project(name)
+        root = self.root
+        self.executor.submit_write(
+            SQLitePersistence.create_project, name,
+            callback=lambda _: root.update())
         self.destroy()
-        self.update()
-        self.root.update()
 
     def cancel(self):
         self.destroy()
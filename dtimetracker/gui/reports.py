@@ -1,4 +1,127 @@
+import tkinter as tk
+from tkinter import ttk
+from dtimetracker.core import Duration
+from dtimetracker.persistence import SQLitePersistence
+from dtimetracker.reports import ReportEngine
 from .child import ChildWindow
 
+ALL_PROJECTS = "All projects"
+
+
 class ReportsWindow(ChildWindow):
-    pass
+    def init_widgets(self):
+        # project selector
+        project_label = tk.Label(self, text="Project")
+        project_label.grid(column=0, row=0, padx=5, pady=5, sticky=tk.W)
+
+        self.project_selector_var = tk.StringVar(value=ALL_PROJECTS)
+        project_selector = ttk.OptionMenu(
+            self,
+            self.project_selector_var)
+        project_selector.grid(column=1, row=0, padx=5, pady=5)
+        self.project_menu = project_selector['menu']
+
+        # period selector
+        period_label = tk.Label(self, text="Report")
+        period_label.grid(column=0, row=1, padx=5, pady=5, sticky=tk.W)
+
+        self.period_var = tk.StringVar(value="Daily")
+        period_selector = ttk.OptionMenu(
+            self,
+            self.period_var)
+        period_selector.grid(column=1, row=1, padx=5, pady=5)
+        self.period_menu = period_selector['menu']
+
+        self.subframe = self.init_scrollbar(
+            row=2, column=0, columnspan=2)['subframe']
+
+        # header
+        period_header = ttk.Label(self.subframe, text="Period")
+        period_header.grid(row=0, column=0, padx=5, pady=5)
+        total_header = ttk.Label(self.subframe, text="Total")
+        total_header.grid(row=0, column=1, padx=5, pady=5)
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.title("Reports")
+        self.report_rows = []
+
+        self.init_widgets()
+        self.populate_project_optionmenu()
+        self.populate_period_optionmenu()
+        self.update()
+
+    def populate_project_optionmenu(self):
+        project_names = [ALL_PROJECTS] + SQLitePersistence.get_project_names()
+
+        for project_name in project_names:
+            self.project_menu.add_command(
+                label=project_name,
+                command=lambda n=project_name: self.clicked_project(n))
+
+    def populate_period_optionmenu(self):
+        for period_name in ("Daily", "Weekly", "Monthly"):
+            self.period_menu.add_command(
+                label=period_name,
+                command=lambda n=period_name: self.clicked_period(n))
+
+    def clicked_project(self, project_name):
+        self.project_selector_var.set(project_name)
+        self.update()
+
+    def clicked_period(self, period_name):
+        self.period_var.set(period_name)
+        self.update()
+
+    def get_period(self):
+        return {
+            "Daily": "day",
+            "Weekly": "week",
+            "Monthly": "month",
+        }[self.period_var.get()]
+
+    def update(self):
+        period = self.get_period()
+        self.executor.submit(
+            self._load_totals, period, self.project_selector_var.get(),
+            callback=lambda totals: self.show_totals(period, totals),
+            key=(self, "totals"))
+
+    @staticmethod
+    def _load_totals(period, project_name):
+        # Runs on a worker thread
+        project_id = None
+        if project_name != ALL_PROJECTS:
+            project = SQLitePersistence.get_project_by_name(project_name)
+            project_id = project.id if project else None
+
+        from_, to = ReportEngine.get_default_range(period)
+        rows = ReportEngine.get_totals(period, from_, to, project_id)
+        return ReportEngine.sum_by_period(rows)
+
+    def show_totals(self, period, totals):
+        if not self.winfo_exists():
+            return
+
+        for row in self.report_rows:
+            row.destroy()
+        self.report_rows = []
+
+        for row_num, period_start in enumerate(sorted(totals), start=1):
+            label = ReportEngine.get_period_label(period, period_start)
+            self.report_rows.append(
+                ReportRow(self.subframe, row_num, label,
+                          totals[period_start]))
+
+
+class ReportRow():
+    def __init__(self, root, row_number, label, seconds):
+        self.period_label = ttk.Label(root, text=label)
+        self.period_label.grid(row=row_number, column=0, padx=5, pady=5)
+
+        self.total_label = ttk.Label(root, text=str(Duration(seconds)))
+        self.total_label.grid(row=row_number, column=1, padx=5, pady=5)
+
+    def destroy(self):
+        self.period_label.destroy()
+        self.total_label.destroy()
@@ -0,0 +1,69 @@
+import time
+
+
+class RefreshScheduler:
+    """Drives the periodic and on-demand updates of a window from Tk's
+    event loop.
+
+    Tick callbacks run about once every interval ms, lined up with the
+    wall clock, and must only touch in-memory state. Refreshers are the
+    expensive updates that query SQLite: they only run after invalidate(),
+    and all invalidations made before control gets back to the event loop
+    are merged, so each refresher runs at most once per flush.
+    """
+
+    def __init__(self, root, interval=1000):
+        self.root = root
+        self.interval = interval
+
+        self._tick_callbacks = []
+        self._refreshers = {}
+        self._dirty = set()
+        self._tick_id = None
+        self._flush_id = None
+
+    def on_tick(self, callback):
+        self._tick_callbacks.append(callback)
+
+    def add_refresher(self, name, callback):
+        self._refreshers[name] = callback
+
+    def invalidate(self, *names):
+        """Marks refreshers (all of them by default) to run on the next
+        flush."""
+        self._dirty.update(names or self._refreshers)
+        if self._flush_id is None:
+            self._flush_id = self.root.after(0, self._flush)
+
+    def start(self):
+        if self._tick_id is None:
+            self._schedule_tick()
+
+    def stop(self):
+        for after_id in (self._tick_id, self._flush_id):
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+        self._tick_id = None
+        self._flush_id = None
+        self._dirty.clear()
+
+    def _schedule_tick(self):
+        # Wait until the next whole interval so the seconds shown change
+        # together with the system clock
+        now_ms = int(time.time() * 1000)
+        delay = self.interval - now_ms % self.interval
+        self._tick_id = self.root.after(delay, self._tick)
+
+    def _tick(self):
+        # Reschedule first, so a failing callback doesn't stop the clock
+        self._schedule_tick()
+        for callback in self._tick_callbacks:
+            callback()
+
+    def _flush(self):
+        self._flush_id = None
+        dirty, self._dirty = self._dirty, set()
+
+        for name, refresh in self._refreshers.items():
+            if name in dirty:
+                refresh()
@@ -1,8 +1,10 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog, messagebox
+from dtimetracker.export import SessionExporter
 from dtimetracker.persistence import SQLitePersistence
-from dtimetracker.core import Session
+from dtimetracker.core import Session, to_timestamp
 from .child import ChildWindow
+from .virtual_list import VirtualList
 from datetime import datetime, date, time, timedelta
 from tkcalendar import Calendar
 
@@ -31,8 +33,26 @@ class SessionsWindow(ChildWindow):
         time_selector.grid(column=1, row=1, columnspan=3, padx=5, pady=5)
         self.time_menu = time_selector['menu']
 
-        subframe = self.init_scrollbar(
-            row=4, column=0, columnspan=4)['subframe']
+        # export button
+        export_button = ttk.Button(
+            self, text="Export...", command=lambda: MakeCSVWindow(self))
+        export_button.grid(column=0, row=2, columnspan=4, padx=5, pady=5)
+
+        # total of the scope
+        total_label = tk.Label(self, text="Total")
+        total_label.grid(column=0, row=3, padx=5, pady=5, sticky=tk.W)
+
+        self.total_time_var = tk.StringVar()
+        total_time = tk.Label(self, textvariable=self.total_time_var)
+        total_time.grid(column=1, row=3, columnspan=3, padx=5, pady=5)
+
+        # Only the visible rows have widgets, which are reused on scroll
+        self.session_list = VirtualList(
+            self,
+            lambda frame, row_num: SessionRow(frame, self, row_num),
+            key=lambda session: session.id)
+        self.session_list.grid(row=4, column=0, columnspan=4)
+        subframe = self.session_list
 
         # header
         #   Start
@@ -50,9 +70,12 @@ class SessionsWindow(ChildWindow):
 
     def __init__(self, root):
         super().__init__(root)
+        self.snapshot = root.snapshot
         self.init_widgets()
         self.selected_project = None
+        self.archived_ids = set()
         self.selected_time_string = ''
+        self.project_menu_version = None
 
         self.set_project_optionmenu_default()
         self.set_time_optionmenu_default()
@@ -78,21 +101,64 @@ class SessionsWindow(ChildWindow):
 
     def update_session_rows(self):
         start, end = self.get_date_range()
-        sessions = SQLitePersistence.get_sessions(
-            self.selected_project.id, start, end)
-        row_num = 1
+        self.executor.submit(
+            self._load_session_rows,
+            self.selected_project.id, start, end,
+            callback=lambda result: self.show_session_rows(*result),
+            key=(self, "session_rows"))
+        self.update_total()
+
+    @staticmethod
+    def _load_session_rows(project_id, start, end):
+        # Runs on a worker thread
+        return (SQLitePersistence.get_sessions(project_id, start, end),
+                SQLitePersistence.get_archived_session_ids(
+                    project_id, start, end))
+
+    def update_total(self):
+        # Sessions count by their start, like the rows listed, so the
+        # total is their sum
+        start, end = self.get_date_range()
+        self.executor.submit(
+            self.snapshot.get_total_duration,
+            self.selected_project.id, start, end,
+            callback=self.show_total,
+            key=(self, "total"))
+
+    def show_total(self, total):
+        if not self.winfo_exists():
+            return
+
+        self.total_time_var.set(str(total))
 
-        if not hasattr(self, "session_row_dict"):
-            self.session_row_dict = {}
+    def show_session_rows(self, sessions, archived_ids):
+        if not self.winfo_exists():
+            return
 
-        # Delete existing rows
-        for key in self.session_row_dict:
-            self.session_row_dict[key].destroy()
+        self.archived_ids = archived_ids
+        self.session_list.set_items(sessions)
 
-        for session in sessions:
-            self.session_row_dict[session.id] = SessionRow(
-                self.subframe, self, row_num, session)
-            row_num += 1
+    def session_changed(self, session):
+        if not self.winfo_exists():
+            return
+
+        # Patches the one edited row instead of reloading the whole scope
+        start, end = self.get_date_range()
+        if (session.project_id == self.selected_project.id
+                and (to_timestamp(start)
+                     <= to_timestamp(session.start)
+                     <= to_timestamp(end))):
+            self.session_list.update_item(session)
+        else:
+            self.session_list.remove_item(session)
+        self.update_total()
+
+    def session_deleted(self, session):
+        if not self.winfo_exists():
+            return
+
+        self.session_list.remove_item(session)
+        self.update_total()
 
     def clicked_project(self, project_name):
         self.selected_project = SQLitePersistence.get_project_by_name(
@@ -101,6 +167,11 @@ class SessionsWindow(ChildWindow):
         self.update()
 
     def update_project_optionmenu(self):
+        # projects haven't changed since the menu was built
+        if (self.project_menu_version
+                == SQLitePersistence.get_projects_version()):
+            return
+
         self.project_menu.delete(0, 'end')
 
         project_names = SQLitePersistence.get_project_names()
@@ -111,6 +182,7 @@ class SessionsWindow(ChildWindow):
         self.populate_project_optionmenu()
 
     def populate_project_optionmenu(self):
+        self.project_menu_version = SQLitePersistence.get_projects_version()
         project_names = SQLitePersistence.get_project_names()
 
         for project_name in project_names:
@@ -203,50 +275,80 @@ class SessionsWindow(ChildWindow):
 
 
 class SessionRow():
-    def __init__(self, root, toplevel, row_number, session):
+    def __init__(self, root, toplevel, row_number):
         self.toplevel = toplevel
+        self.session = None
+        self.shown = None
         # Session row
         #   Start
-        self.start_label = ttk.Label(
-            root, text=session.start.strftime("%b %d, %H:%M"))
+        self.start_label = ttk.Label(root)
         self.start_label.grid(row=row_number, column=0, padx=5, pady=5)
         #   End
-        end_string = ""
-        if session.end:
-            end_string = session.end.strftime("%b %d, %H:%M")
-        else:
-            end_string = "Open"
-        self.end_label = ttk.Label(root,
-                                   text=end_string)
+        self.end_label = ttk.Label(root)
         self.end_label.grid(row=row_number, column=1, padx=5, pady=5)
         #   Duration
-        self.duration_label = ttk.Label(
-            root, text=str(session.get_pretty_duration()))
+        self.duration_label = ttk.Label(root)
         self.duration_label.grid(row=row_number, column=2, padx=5, pady=5)
         #   Edit
         self.edit_label = ttk.Button(
             root,
             text="Edit",
-            command=lambda: EditSessionWindow(self.toplevel, session))
+            command=lambda: EditSessionWindow(self.toplevel, self.session))
         self.edit_label.grid(row=row_number, column=3, padx=5, pady=5)
         #   Delete
         self.delete_label = ttk.Button(
             root,
             text="Delete",
-            command=lambda: self.deleteSession(session))
+            command=lambda: self.deleteSession(self.session))
         self.delete_label.grid(row=row_number, column=4, padx=5, pady=5)
 
+    def widgets(self):
+        return (self.start_label, self.end_label, self.duration_label,
+                self.edit_label, self.delete_label)
+
+    def show(self, session):
+        self.session = session
+
+        # Open sessions keep growing, everything else only changes on edit
+        archived = session.id in self.toplevel.archived_ids
+        shown = (session.id, session.start, session.end, archived)
+        if shown == self.shown and session.end is not None:
+            return
+        self.shown = shown
+
+        # Archived sessions are read-only
+        state = ["disabled"] if archived else ["!disabled"]
+        self.edit_label.state(state)
+        self.delete_label.state(state)
+
+        end_string = ""
+        if session.end:
+            end_string = session.end.strftime("%b %d, %H:%M")
+        else:
+            end_string = "Open"
+
+        self.start_label.config(text=session.start.strftime("%b %d, %H:%M"))
+        self.end_label.config(text=end_string)
+        self.duration_label.config(text=str(session.get_pretty_duration()))
+
+        for widget in self.widgets():
+            widget.grid()
+
+    def hide(self):
+        self.session = None
+        self.shown = None
+        for widget in self.widgets():
+            widget.grid_remove()
+
     def destroy(self):
-        self.start_label.destroy()
-        self.end_label.destroy()
-        self.duration_label.destroy()
-        self.edit_label.destroy()
-        self.delete_label.destroy()
+        for widget in self.widgets():
+            widget.destroy()
         del self
 
     def deleteSession(self, session):
-        SQLitePersistence.delete_session(session)
-        self.toplevel.update()
+        self.toplevel.executor.submit_write(
+            SQLitePersistence.delete_session, session,
+            callback=lambda _: self.toplevel.session_deleted(session))
 
 
 class EditSessionWindow(ChildWindow):
@@ -369,7 +471,6 @@ class EditSessionWindow(ChildWindow):
 
     def clicked_ok(self):
         self.update()
-        self.root.update()
         self.destroy()
 
     def clicked_cancel(self):
@@ -379,7 +480,12 @@ class EditSessionWindow(ChildWindow):
         tmp_s = self.make_session_from_input()
         self.session.start = tmp_s.start
         self.session.end = tmp_s.end
-        SQLitePersistence.update_session(self.session)
+
+        # The sessions window patches the row once the write committed
+        session = self.session
+        self.executor.submit_write(
+            SQLitePersistence.update_session, session,
+            callback=lambda _: self.root.session_changed(session))
 
         # duration
         self.update_duration()
@@ -531,8 +637,141 @@ class ReportsWindow(ChildWindow):
 
 
 class MakeCSVWindow(ChildWindow):
+    """Exports the sessions in the scope picked in the sessions window."""
+
+    all_projects = "All projects"
+
+    statuses = {
+        "All sessions": None,
+        "Open sessions": "open",
+        "Closed sessions": "closed",
+    }
+
+    formats = {
+        "CSV": "csv",
+        "TSV": "tsv",
+    }
+
+    def init_widgets(self):
+        # project selector
+        project_label = tk.Label(self, text="Project")
+        project_label.grid(column=0, row=0, padx=5, pady=5, sticky=tk.W)
+
+        project_names = SQLitePersistence.get_project_names()
+        self.project_var = tk.StringVar()
+        project_selector = ttk.OptionMenu(
+            self, self.project_var, self.root.project_selector_var.get(),
+            MakeCSVWindow.all_projects, *project_names)
+        project_selector.grid(column=1, row=0, padx=5, pady=5)
+
+        # status selector
+        status_label = tk.Label(self, text="Sessions")
+        status_label.grid(column=0, row=1, padx=5, pady=5, sticky=tk.W)
+
+        self.status_var = tk.StringVar()
+        status_selector = ttk.OptionMenu(
+            self, self.status_var, "All sessions", *MakeCSVWindow.statuses)
+        status_selector.grid(column=1, row=1, padx=5, pady=5)
+
+        # format selector
+        format_label = tk.Label(self, text="Format")
+        format_label.grid(column=0, row=2, padx=5, pady=5, sticky=tk.W)
+
+        self.format_var = tk.StringVar()
+        format_selector = ttk.OptionMenu(
+            self, self.format_var, "CSV", *MakeCSVWindow.formats)
+        format_selector.grid(column=1, row=2, padx=5, pady=5)
+
+        # scope, taken from the sessions window
+        scope_label = tk.Label(self, text="Scope")
+        scope_label.grid(column=0, row=3, padx=5, pady=5, sticky=tk.W)
+        scope = ttk.Label(self, text=self.root.time_name_var.get())
+        scope.grid(column=1, row=3, padx=5, pady=5)
+
+        # export button
+        self.export_button = ttk.Button(
+            self, text="Export", command=self.clicked_export)
+        self.export_button.grid(column=0, row=4, columnspan=2, padx=5, pady=5)
+
+        self.progress_var = tk.StringVar()
+        progress_label = ttk.Label(self, textvariable=self.progress_var)
+        progress_label.grid(column=0, row=5, columnspan=2, padx=5, pady=5)
+
     def __init__(self, root):
         super().__init__(root)
+        self.title("Export sessions")
+        self.root = root
+        self.progress = None
+        self.progress_id = None
+
+        self.init_widgets()
+
+    def clicked_export(self):
+        format = MakeCSVWindow.formats[self.format_var.get()]
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            defaultextension=f".{format}",
+            filetypes=[(self.format_var.get(), f"*.{format}")])
+        if not path:
+            return
+
+        project_ids = None
+        if self.project_var.get() != MakeCSVWindow.all_projects:
+            project = SQLitePersistence.get_project_by_name(
+                self.project_var.get())
+            project_ids = [project.id]
+        from_, to = self.root.get_date_range()
+        status = MakeCSVWindow.statuses[self.status_var.get()]
+
+        self.export_button.state(["disabled"])
+        self.progress = (0, None)
+        self.executor.submit(
+            lambda: SessionExporter.export_to_path(
+                path, project_ids, from_, to, status, format,
+                progress=self.set_progress),
+            callback=self.export_done,
+            errback=self.export_failed,
+            key=(self, "export"))
+        self.show_progress()
+
+    def set_progress(self, done, total):
+        # Runs on the worker thread, show_progress() picks it up
+        self.progress = (done, total)
+
+    def show_progress(self):
+        self.progress_id = None
+        if self.progress is None or not self.winfo_exists():
+            return
+
+        done, total = self.progress
+        if total is None:
+            self.progress_var.set("Exporting...")
+        else:
+            self.progress_var.set(f"Exported {done} of {total} sessions")
+        self.progress_id = self.after(100, self.show_progress)
+
+    def stop_progress(self):
+        self.progress = None
+        if self.progress_id is not None:
+            self.after_cancel(self.progress_id)
+            self.progress_id = None
+
+    def export_done(self, count):
+        self.stop_progress()
+        if not self.winfo_exists():
+            return
+
+        self.progress_var.set(f"Exported {count} sessions")
+        self.export_button.state(["!disabled"])
+
+    def export_failed(self, exception):
+        self.stop_progress()
+        if not self.winfo_exists():
+            return
+
+        self.progress_var.set("")
+        self.export_button.state(["!disabled"])
+        messagebox.showerror("Export failed", str(exception), parent=self)
 
 
 class CustomDateSelectionWindow(ChildWindow):
@@ -0,0 +1,126 @@
+from tkinter import ttk
+
+
+class VirtualList(ttk.Frame):
+    """A scrollable list that only has widgets for the visible rows.
+
+    make_row(frame, row_number) builds one reusable row object with
+    show(item) and hide() methods. visible_rows of them are created once;
+    scrolling just shows different items in the same rows, so the cost of
+    set_items() doesn't grow with the number of items. key(item) tells
+    which items are the same for update_item() and remove_item().
+    """
+
+    def __init__(self, root, make_row, visible_rows=15, header_rows=1,
+                 key=None):
+        super().__init__(root)
+        self.key = key or (lambda item: item)
+        self.items = []
+        self.offset = 0
+        self.visible_rows = visible_rows
+
+        self.scrollbar = ttk.Scrollbar(
+            self, orient="vertical", command=self.yview)
+        self.scrollbar.grid(
+            row=0, column=99, rowspan=header_rows + visible_rows,
+            sticky="ns")
+
+        self.rows = [make_row(self, header_rows + i)
+                     for i in range(visible_rows)]
+
+        # Only scroll with the wheel while the pointer is over the list
+        self.bind("<Enter>", self._bind_wheel)
+        self.bind("<Leave>", self._unbind_wheel)
+
+        self.refresh()
+
+    def set_items(self, items):
+        self.items = items
+        self.offset = max(0, min(self.offset, self._max_offset()))
+        self.refresh()
+
+    def update_item(self, item):
+        """Replaces the item with the same key, redrawing only its row."""
+        index = self._index_of(item)
+        if index is None:
+            return
+
+        self.items[index] = item
+        if self.offset <= index < self.offset + self.visible_rows:
+            self.rows[index - self.offset].show(item)
+
+    def remove_item(self, item):
+        index = self._index_of(item)
+        if index is None:
+            return
+
+        del self.items[index]
+        self.offset = max(0, min(self.offset, self._max_offset()))
+        if index < self.offset + self.visible_rows:
+            self.refresh()
+        else:
+            self._update_scrollbar()
+
+    def refresh(self):
+        for i, row in enumerate(self.rows):
+            index = self.offset + i
+            if index < len(self.items):
+                row.show(self.items[index])
+            else:
+                row.hide()
+
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if self.items:
+            first = self.offset / len(self.items)
+            last = min(self.offset + self.visible_rows,
+                       len(self.items)) / len(self.items)
+        else:
+            first, last = 0.0, 1.0
+        self.scrollbar.set(first, last)
+
+    def yview(self, *args):
+        match args:
+            case ("moveto", fraction):
+                offset = round(float(fraction) * len(self.items))
+            case ("scroll", number, "pages"):
+                offset = self.offset + int(number) * self.visible_rows
+            case ("scroll", number, _):
+                offset = self.offset + int(number)
+            case _:
+                return
+
+        self.scroll_to(offset)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self._max_offset()))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def _index_of(self, item):
+        key = self.key(item)
+        for index, other in enumerate(self.items):
+            if self.key(other) == key:
+                return index
+        return None
+
+    def _max_offset(self):
+        return max(0, len(self.items) - self.visible_rows)
+
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.offset - 3)
+        else:
+            self.scroll_to(self.offset + 3)
+
+    def _bind_wheel(self, event):
+        self.bind_all("<MouseWheel>", self._on_wheel)
+        self.bind_all("<Button-4>", self._on_wheel)
+        self.bind_all("<Button-5>", self._on_wheel)
+
+    def _unbind_wheel(self, event):
+        self.unbind_all("<MouseWheel>")
+        self.unbind_all("<Button-4>")
+        self.unbind_all("<Button-5>")
@@ -0,0 +1,209 @@
+import csv
+from datetime import datetime
+import json
+import os
+import time
+from .core import to_timestamp
+from .persistence import SQLitePersistence
+
+
+class ImportReport:
+    """What an import did: counts, throughput and the rejected rows.
+
+    Only the first max_rejected rejections are kept with their line
+    number and reason; rejected counts all of them.
+    """
+
+    def __init__(self, max_rejected=1000):
+        self.max_rejected = max_rejected
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejected_rows = []
+        self.created_projects = []
+        self.seconds = 0.0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejected_rows) < self.max_rejected:
+            self.rejected_rows.append((line, reason))
+
+    @property
+    def rows_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.read / self.seconds
+
+    def __str__(self):
+        return (f"read {self.read} rows in {self.seconds:.2f}s "
+                f"({self.rows_per_second:.0f} rows/s): "
+                f"{self.imported} imported, {self.duplicates} duplicates, "
+                f"{self.rejected} rejected")
+
+
+class SessionImporter:
+    """Loads session history from CSV, TSV or JSON Lines files.
+
+    Every row needs a project name, a start and an end, given as ISO 8601
+    date-times (as written by SessionExporter) or as epoch seconds. Other
+    columns are ignored. A row whose project already has a session with
+    the same start counts as a duplicate and is skipped.
+    """
+
+    formats = {
+        ".csv": "csv",
+        ".tsv": "tsv",
+        ".jsonl": "jsonl",
+        ".ndjson": "jsonl",
+    }
+
+    @classmethod
+    def import_file(cls, path, format=None, **options):
+        """Imports a file, picking the format from its extension unless
+        given. options are passed on to import_records."""
+        if format is None:
+            extension = os.path.splitext(path)[1].lower()
+            format = SessionImporter.formats.get(extension)
+            if format is None:
+                raise ValueError(f"Unknown import file type: {extension}")
+
+        with open(path, newline="", encoding="utf-8") as file:
+            return SessionImporter.import_records(
+                SessionImporter.read_records(file, format), **options)
+
+    @classmethod
+    def read_records(cls, file, format):
+        """Yields (line number, record) pairs, record being a dict or,
+        for unreadable lines, the error message."""
+        match format:
+            case "csv" | "tsv":
+                dialect = "excel" if format == "csv" else "excel-tab"
+                reader = csv.DictReader(file, dialect=dialect)
+                for record in reader:
+                    yield (reader.line_num, record)
+            case "jsonl":
+                for line_number, line in enumerate(file, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        record = f"invalid JSON: {e}"
+                    if not isinstance(record, (dict, str)):
+                        record = "not a JSON object"
+                    yield (line_number, record)
+            case _:
+                raise ValueError(f"Unknown import format: {format}")
+
+    @classmethod
+    def import_records(cls, records, create_projects=True, batch_size=10000,
+                       max_rejected=1000):
+        """Validates and stores (line number, record) pairs.
+
+        Unknown projects are created unless create_projects is False, in
+        which case their rows are rejected. Sessions are committed
+        batch_size at a time. Returns an ImportReport.
+        """
+        report = ImportReport(max_rejected)
+        started = time.perf_counter()
+
+        # One lookup for the whole import, kept up to date as projects
+        # are created
+        project_ids = {project.name: project.id
+                       for project in SQLitePersistence.get_projects()}
+
+        batch = []
+        for line, record in records:
+            report.read += 1
+            try:
+                batch.append(SessionImporter._validate(
+                    record, project_ids, create_projects, report))
+            except ValueError as e:
+                report.reject(line, str(e))
+                continue
+
+            if len(batch) >= batch_size:
+                SessionImporter._write_batch(batch, report)
+                batch = []
+
+        if batch:
+            SessionImporter._write_batch(batch, report)
+
+        report.seconds = time.perf_counter() - started
+        return report
+
+    @classmethod
+    def _validate(cls, record, project_ids, create_projects, report):
+        """Returns (project_id, start, end) in epoch seconds, or raises
+        ValueError with the reason the record is rejected."""
+        if isinstance(record, str):
+            raise ValueError(record)
+
+        name = record.get("project")
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("missing project")
+        name = name.strip()
+
+        start = SessionImporter._parse_time(record.get("start"), "start")
+        end = SessionImporter._parse_time(record.get("end"), "end")
+        if end < start:
+            raise ValueError("negative duration")
+
+        project_id = project_ids.get(name)
+        if project_id is None:
+            if not create_projects:
+                raise ValueError(f"unknown project: {name}")
+            project_id = SQLitePersistence.create_project(name).id
+            project_ids[name] = project_id
+            report.created_projects.append(name)
+
+        return (project_id, start, end)
+
+    @classmethod
+    def _parse_time(cls, value, field):
+        if isinstance(value, str):
+            value = value.strip()
+            if value.isdigit():
+                value = int(value)
+
+        if value is None or value == "":
+            raise ValueError(f"missing {field}")
+        if isinstance(value, bool):
+            raise ValueError(f"invalid {field}: {value!r}")
+        if isinstance(value, int):
+            return value
+
+        try:
+            return to_timestamp(datetime.fromisoformat(value))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"invalid {field}: {value!r}") from None
+
+    @classmethod
+    def _write_batch(cls, batch, report):
+        # Rows whose (project, start) is already stored or came earlier
+        # in the batch are duplicates. Earlier batches are committed by
+        # now, so checking against the table covers them too.
+        by_project = {}
+        for project_id, start, _ in batch:
+            lo, hi = by_project.get(project_id, (start, start))
+            by_project[project_id] = (min(lo, start), max(hi, start))
+
+        seen = {
+            project_id: SQLitePersistence.get_session_starts(
+                project_id, lo, hi)
+            for project_id, (lo, hi) in by_project.items()
+        }
+
+        sessions = []
+        for project_id, start, end in batch:
+            starts = seen[project_id]
+            if start in starts:
+                report.duplicates += 1
+                continue
+            starts.add(start)
+            sessions.append((project_id, start, end))
+
+        if sessions:
+            SQLitePersistence.create_sessions(sessions)
+            report.imported += len(sessions)
@@ -0,0 +1,288 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import itertools
+import threading
+from .archive import SessionArchive
+from .core import Duration, to_timestamp
+from .persistence import SQLitePersistence
+
+
+class SortedSums:
+    """A sorted list of integers with running sums, so the count and sum
+    of the values up to t take one bisect."""
+
+    def __init__(self, values=()):
+        self.values = sorted(values)
+        self.prefix = [0]
+        # Prefix sums are valid up to this index
+        self._valid = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        i = bisect_right(self.values, value)
+        self.values.insert(i, value)
+        self._invalidate(i)
+
+    def remove(self, value):
+        i = bisect_left(self.values, value)
+        if i < len(self.values) and self.values[i] == value:
+            del self.values[i]
+            self._invalidate(i)
+
+    def _invalidate(self, i):
+        self._valid = min(self._valid, i)
+        del self.prefix[i + 1:]
+
+    def up_to(self, t):
+        """Returns the count and sum of the values <= t."""
+        if self._valid < len(self.values):
+            # Values are mostly added at the end, which only costs the
+            # new entries here
+            prefix = self.prefix
+            for value in self.values[self._valid:]:
+                prefix.append(prefix[-1] + value)
+            self._valid = len(self.values)
+
+        i = bisect_right(self.values, t)
+        return (i, self.prefix[i])
+
+
+class ProjectIntervals:
+    """The sessions of one project as separately sorted starts and ends,
+    each with running sums.
+
+    Up to t, closed sessions have logged
+    F(t) = sum(ends <= t) + t * #(ends > t) - sum(starts <= t)
+           - t * #(starts > t)
+    seconds, so the time spent between lo and hi, with sessions sticking
+    out of the range cut off, is F(hi) - F(lo): four bisects, however
+    long the sessions are.
+
+    Open sessions are kept aside and run up to the now given to total().
+    """
+
+    def __init__(self, rows=()):
+        closed = []
+        self.open = {}
+        for id, start, end in rows:
+            if end is None:
+                self.open[id] = start
+            else:
+                # A negative session counts as 0 seconds
+                closed.append((start, max(end, start)))
+
+        self.starts = SortedSums(start for start, _ in closed)
+        self.ends = SortedSums(end for _, end in closed)
+
+    def __len__(self):
+        return len(self.starts) + len(self.open)
+
+    def add(self, id, start, end):
+        if end is None:
+            self.open[id] = start
+        else:
+            self.starts.add(start)
+            self.ends.add(max(end, start))
+
+    def remove(self, id, start, end):
+        if end is None:
+            self.open.pop(id, None)
+        else:
+            self.starts.remove(start)
+            self.ends.remove(max(end, start))
+
+    def _logged_until(self, t):
+        count = len(self.starts)
+        ended, end_sum = self.ends.up_to(t)
+        started, start_sum = self.starts.up_to(t)
+        return (end_sum + t * (count - ended)
+                - start_sum - t * (count - started))
+
+    def total(self, lo, hi, now):
+        """Returns the seconds spent between lo and hi (epoch seconds)."""
+        if hi <= lo:
+            return 0
+
+        total = self._logged_until(hi) - self._logged_until(lo)
+        for start in self.open.values():
+            total += max(min(now, hi) - max(start, lo), 0)
+
+        return total
+
+
+class IntervalIndex:
+    """In-memory ProjectIntervals of the projects asked about.
+
+    A project's sessions, live and archived, are loaded on its first
+    query. Once attach()ed, session writes are applied as they commit, so
+    later queries only read the session version: if another process wrote
+    sessions, the loaded projects are dropped and loaded again.
+
+    Loading reads in one read transaction and never holds up session
+    writes; the changes they make meanwhile are replayed on top.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._projects = {}
+        # Session version the loaded projects reflect, None while nothing
+        # is loaded
+        self._version = None
+        # (changes, version) lists of the loads in progress
+        self._loading = []
+        self._attached = False
+
+    def attach(self):
+        with SQLitePersistence.hold_session_changes():
+            if not self._attached:
+                SQLitePersistence.add_session_listener(self.session_changed)
+                self._attached = True
+
+    def detach(self):
+        with SQLitePersistence.hold_session_changes():
+            if self._attached:
+                SQLitePersistence.remove_session_listener(
+                    self.session_changed)
+                self._attached = False
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._projects = {}
+        self._version = None
+
+    def session_changed(self, changes, version):
+        """Session listener: patches the loaded projects."""
+        with self._lock:
+            for replay in self._loading:
+                replay.append((changes, version))
+
+            if self._version is None or version <= self._version:
+                # Nothing loaded, or already read by a load
+                return
+            if version != self._version + 1:
+                # Writes were missed, projects are loaded again
+                self._clear()
+                return
+
+            self._version = version
+            for old, new in changes:
+                if old is not None:
+                    id, start, end, project_id = old
+                    intervals = self._projects.get(project_id)
+                    if intervals is not None:
+                        intervals.remove(id, start, end)
+                if new is not None:
+                    id, start, end, project_id = new
+                    intervals = self._projects.get(project_id)
+                    if intervals is not None:
+                        intervals.add(id, start, end)
+
+    def _check_version(self):
+        version = SQLitePersistence.get_session_version()
+        with self._lock:
+            if self._version is None or self._version >= version:
+                return
+
+        # A write of this process may be calling the listeners right now;
+        # once it is done the index has its changes
+        with SQLitePersistence.hold_session_changes():
+            pass
+        with self._lock:
+            if self._version is not None and self._version < version:
+                # Written by another process
+                self._clear()
+
+    def _get_project(self, project_id):
+        if not self._attached:
+            return self._load(project_id)[0]
+
+        self._check_version()
+        with self._lock:
+            intervals = self._projects.get(project_id)
+            if intervals is not None:
+                return intervals
+
+            replay = []
+            self._loading.append(replay)
+
+        try:
+            intervals, version = self._load(project_id)
+        finally:
+            with self._lock:
+                self._loading.remove(replay)
+
+        with self._lock:
+            # Writes committed while loading, on top
+            for changes, change_version in replay:
+                if change_version <= version:
+                    continue
+                if change_version != version + 1:
+                    # Writes were missed, the project isn't kept
+                    return intervals
+                for old, new in changes:
+                    if old is not None and old[3] == project_id:
+                        intervals.remove(*old[:3])
+                    if new is not None and new[3] == project_id:
+                        intervals.add(*new[:3])
+                version = change_version
+
+            if self._version is None or self._version < version:
+                # The other projects are older, if any
+                self._projects = {}
+                self._version = version
+            self._projects[project_id] = intervals
+        return intervals
+
+    def _load(self, project_id):
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        # One read transaction, so all of it, archive files included, is
+        # as of `version`
+        cur.execute("BEGIN;")
+        archive = SessionArchive(SQLitePersistence._get_archive_directory())
+        try:
+            version = SQLitePersistence.get_session_version()
+            archive.open([name for name, in cur.execute(
+                "SELECT name FROM archive_files;").fetchall()])
+
+            archived = archive.iter_rows(
+                project_id, float("-inf"), float("inf"))
+            cur.execute("""
+                SELECT id, start, end FROM sessions WHERE
+                project_id = ?
+            """, (project_id,))
+
+            intervals = ProjectIntervals(itertools.chain(
+                cur, ((id, start, end) for id, start, end, _ in archived)))
+        finally:
+            con.rollback()
+            archive.close()
+
+        return (intervals, version)
+
+    def get_total_durations(self, project_id, windows, now=None):
+        """Returns {name: Duration} for a list of (name, from_, to) windows,
+        counting the time spent inside each window.
+
+        Open sessions count up to now (epoch seconds), by default the
+        moment the totals are computed.
+        """
+        intervals = self._get_project(project_id)
+        if now is None:
+            now = to_timestamp(datetime.now())
+
+        with self._lock:
+            return {name: Duration(intervals.total(
+                        to_timestamp(from_), to_timestamp(to), now))
+                    for name, from_, to in windows}
+
+    def get_total_duration(self, project_id, from_, to):
+        return self.get_total_durations(
+            project_id, [("total", from_, to)])["total"]
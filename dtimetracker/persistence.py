@@ -1,8 +1,15 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
-import sqlite3
+from datetime import datetime, timedelta
+import heapq
+import itertools
 import os
-from .core import Project, Session
+import shutil
+import threading
+from .core import (
+    Duration, Project, Session, SessionBatch, from_timestamp, to_timestamp)
+from .pool import ConnectionPool
+from .cache import ProjectCatalogue, RangeCache
+from .archive import SessionArchive
 
 
 class PersistenceBaseClass(ABC):
@@ -50,29 +57,209 @@ class PersistenceBaseClass(ABC):
 
 class SQLitePersistence(PersistenceBaseClass):
     _db_name = "dtimetracker.db"
-    _con = None
+    _pool = None
+    _pool_size = 8
+    _projects = ProjectCatalogue()
+    _ranges = RangeCache()
+    _archive = None
+    _archive_lock = threading.Lock()
+    _session_listeners = []
+    _session_changes_lock = threading.RLock()
+
+    # Named sets of PRAGMAs applied to every new connection
+    connection_profiles = {
+        # SQLite's own defaults: rollback journal, fsync on every commit
+        "safe": {
+            "journal_mode": "DELETE",
+            "synchronous": "FULL",
+            "cache_size": -2000,
+            "mmap_size": 0,
+            "temp_store": "DEFAULT",
+            "busy_timeout": 5000,
+        },
+        # WAL lets reports read while sessions are written, and only
+        # fsyncs on checkpoints. A power loss may drop the last commits
+        # but never corrupts the database.
+        "balanced": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -16000,
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+        # Never fsyncs. For throwaway databases, imports and tests.
+        "fast": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "cache_size": -64000,
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+    }
+
+    _connection_config = connection_profiles["balanced"]
 
     @classmethod
     def get_project_names(cls):
-        projects = SQLitePersistence.get_projects()
-        project_names = []
-        for project in projects:
-            project_names.append(project.name)
-        return project_names
+        return SQLitePersistence._get_project_catalogue().get_names()
 
     @classmethod
-    def _get_connection(cls):
-        if SQLitePersistence._con is None:
-            con = sqlite3.connect(SQLitePersistence._db_name)
-            SQLitePersistence._con = con
-            return SQLitePersistence._con
-        else:
-            return SQLitePersistence._con
+    def get_cache_stats(cls):
+        """Hit/miss counters of the session range cache."""
+        return SQLitePersistence._ranges.stats()
+
+    @classmethod
+    def _invalidate_sessions(cls, rows, version):
+        """Drops cached ranges holding (project_id, start, end) rows, which
+        a write committed as session version.
+
+        Ranges select sessions by their start alone, so the end doesn't
+        matter, even one before the start.
+        """
+        for project_id, start, _ in rows:
+            SQLitePersistence._ranges.invalidate(project_id, [(start, start)])
+        SQLitePersistence._ranges.advance(version)
+
+    @classmethod
+    def _get_session_row(cls, cur, session_id):
+        cur.execute(
+            "SELECT project_id, start, end FROM sessions WHERE id = ?;",
+            (session_id,))
+        return cur.fetchone()
 
     @classmethod
-    def _create_tables(cls):
+    def add_session_listener(cls, listener):
+        """Calls listener(changes, version) after every session write.
+
+        changes is a list of (old, new) pairs of (id, start, end,
+        project_id) rows, old being None for created sessions and new None
+        for deleted ones. version is the session version the write
+        committed, see get_session_version(). Listeners run on the writing
+        thread, one write at a time.
+        """
+        with SQLitePersistence._session_changes_lock:
+            SQLitePersistence._session_listeners.append(listener)
+
+    @classmethod
+    def remove_session_listener(cls, listener):
+        with SQLitePersistence._session_changes_lock:
+            SQLitePersistence._session_listeners.remove(listener)
+
+    @classmethod
+    def hold_session_changes(cls):
+        """Returns a lock that, while held, keeps session writes from
+        committing, so reads under it line up with the listener calls."""
+        return SQLitePersistence._session_changes_lock
+
+    @classmethod
+    def get_session_version(cls):
+        """Goes up with every committed write to the sessions table."""
         con = SQLitePersistence._get_connection()
+        return con.execute(
+            "SELECT version FROM session_version;").fetchone()[0]
+
+    @classmethod
+    def _commit_session_changes(cls, con, changes):
+        """Commits a session write and tells the listeners about it.
+
+        changes may also be a function returning them, which is only
+        called (before the commit) if there are listeners. Returns the
+        committed session version.
+        """
         cur = con.cursor()
+        cur.execute("UPDATE session_version SET version = version + 1;")
+        cur.execute("SELECT version FROM session_version;")
+        version = cur.fetchone()[0]
+
+        with SQLitePersistence._session_changes_lock:
+            listeners = list(SQLitePersistence._session_listeners)
+            if listeners and callable(changes):
+                changes = changes()
+
+            con.commit()
+            for listener in listeners:
+                listener(changes, version)
+
+        return version
+
+    @classmethod
+    def get_projects_version(cls):
+        """Goes up whenever a project is created, renamed or deleted."""
+        return SQLitePersistence._projects.version
+
+    @classmethod
+    def configure(cls, db_name=None, profile="balanced", pool_size=None,
+                  **pragmas):
+        """Sets the database file, pool size and connection PRAGMAs.
+
+        pragmas override single settings of the chosen profile, e.g.
+        configure(profile="safe", cache_size=-64000); a profile of None
+        keeps the current settings. Open connections are closed and
+        reopened with the new settings on next use.
+        """
+        if profile is None:
+            config = dict(SQLitePersistence._connection_config)
+        else:
+            config = dict(SQLitePersistence.connection_profiles[profile])
+        for name, value in pragmas.items():
+            if name not in config:
+                raise ValueError(f"Unknown connection setting: {name}")
+            config[name] = value
+
+        SQLitePersistence.close()
+
+        if db_name is not None:
+            SQLitePersistence._db_name = db_name
+        if pool_size is not None:
+            SQLitePersistence._pool_size = pool_size
+        SQLitePersistence._connection_config = config
+
+    @classmethod
+    def get_connection_config(cls):
+        return dict(SQLitePersistence._connection_config)
+
+    @classmethod
+    def _apply_pragmas(cls, con):
+        for name, value in SQLitePersistence._connection_config.items():
+            con.execute(f"PRAGMA {name} = {value};").fetchall()
+
+    @classmethod
+    def _get_pool(cls):
+        if SQLitePersistence._pool is None:
+            SQLitePersistence._pool = ConnectionPool(
+                SQLitePersistence._db_name,
+                setup=SQLitePersistence._apply_pragmas,
+                max_size=SQLitePersistence._pool_size)
+        return SQLitePersistence._pool
+
+    @classmethod
+    def _get_connection(cls):
+        # Every thread works on its own connection
+        return SQLitePersistence._get_pool().get()
+
+    @classmethod
+    def release_connection(cls):
+        """Lets a thread that is done with the database free its slot."""
+        if SQLitePersistence._pool is not None:
+            SQLitePersistence._pool.release()
+
+    @classmethod
+    def close(cls):
+        if SQLitePersistence._pool is not None:
+            SQLitePersistence._pool.close_all()
+            SQLitePersistence._pool = None
+        SQLitePersistence._projects.invalidate()
+        SQLitePersistence._ranges.clear()
+        SQLitePersistence._ranges.reset_stats()
+        with SQLitePersistence._archive_lock:
+            if SQLitePersistence._archive is not None:
+                SQLitePersistence._archive.close()
+                SQLitePersistence._archive = None
+
+    @classmethod
+    def _create_tables(cls, cur):
         create_projects_query = """
             CREATE TABLE IF NOT EXISTS projects (
                 id INTEGER PRIMARY KEY,
@@ -81,7 +268,7 @@ class SQLitePersistence(PersistenceBaseClass):
         """
 
         create_sessions_table_query = """
-            CREATE TABLE sessions (
+            CREATE TABLE IF NOT EXISTS sessions (
                 id INTEGER PRIMARY KEY,
                 start TEXT    NOT NULL,
                 end TEXT,
@@ -96,65 +283,148 @@ class SQLitePersistence(PersistenceBaseClass):
         cur.execute(create_projects_query)
         cur.execute(create_sessions_table_query)
 
-        con.commit()
+    @classmethod
+    def _create_session_indexes(cls, cur):
+        # Covers get_sessions: range scans never touch the table itself
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS sessions_project_start
+            ON sessions (project_id, start, end);
+        """)
+
+        # Only holds open sessions, so get_open_session is a single lookup
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS sessions_open
+            ON sessions (project_id, start, end)
+            WHERE end IS NULL;
+        """)
 
     @classmethod
-    def init_db(cls):
-        SQLitePersistence._create_tables()
-        return SQLitePersistence
+    def _store_timestamps_as_integers(cls, cur):
+        # Storage format 3: start/end hold epoch seconds instead of local
+        # "%Y-%m-%d %H:%M:%S" strings. Column affinity can't be altered in
+        # place, so the table is rebuilt and the old strings converted.
+        cur.execute("""
+            CREATE TABLE sessions_new (
+                id INTEGER PRIMARY KEY,
+                start INTEGER NOT NULL,
+                end INTEGER,
+                project_id  INTEGER NOT NULL,
+                FOREIGN KEY (project_id)
+                REFERENCES projects (id)
+                ON UPDATE CASCADE
+                ON DELETE CASCADE
+            );
+        """)
+        cur.execute("""
+            INSERT INTO sessions_new (id, start, end, project_id)
+            SELECT
+                id,
+                CAST(strftime('%s', start, 'utc') AS INTEGER),
+                CAST(strftime('%s', end, 'utc') AS INTEGER),
+                project_id
+            FROM sessions;
+        """)
+        cur.execute("DROP TABLE sessions;")
+        cur.execute("ALTER TABLE sessions_new RENAME TO sessions;")
+
+        SQLitePersistence._create_session_indexes(cur)
+
+    # Schema migrations, applied in order. The position in this list + 1 is
+    # the schema version stored in PRAGMA user_version once it has run.
+    _migrations = (
+        "_create_tables",
+        "_create_session_indexes",
+        "_store_timestamps_as_integers",
+        "_create_rollups",
+        "_create_archive_table",
+        "_create_session_version",
+        "_never_reuse_session_ids",
+        "_never_reuse_project_ids",
+        "_create_projects_version",
+    )
 
     @classmethod
-    def delete_db(cls):
+    def _get_schema_version(cls):
         con = SQLitePersistence._get_connection()
-        con.commit()
-        con.close()
-        if os.path.exists(SQLitePersistence._db_name):
-            os.remove(SQLitePersistence._db_name)
-            SQLitePersistence._con = None
+        return con.execute("PRAGMA user_version;").fetchone()[0]
 
     @classmethod
-    def get_projects(cls):
+    def _migrate(cls):
         con = SQLitePersistence._get_connection()
         cur = con.cursor()
-        cur.execute("SELECT * FROM projects;")
-        results = cur.fetchall()
+        version = SQLitePersistence._get_schema_version()
 
-        projects = []
-        for result in results:
-            p = Project(name=result[1], id=result[0])
-            projects.append(p)
+        for migration in SQLitePersistence._migrations[version:]:
+            version += 1
+            cur.execute("BEGIN;")
+            getattr(SQLitePersistence, migration)(cur)
+            cur.execute(f"PRAGMA user_version = {version};")
+            con.commit()
 
-        return projects
+    @classmethod
+    def init_db(cls, db_name=None, profile=None, pool_size=None,
+                **pragmas):
+        SQLitePersistence.configure(db_name, profile, pool_size, **pragmas)
+        SQLitePersistence._migrate()
+        return SQLitePersistence
 
     @classmethod
-    def get_project(cls, project_id):
-        query = "SELECT * FROM projects WHERE id = ?;"
+    def delete_db(cls):
+        SQLitePersistence.close()
+        for suffix in ("", "-wal", "-shm"):
+            path = SQLitePersistence._db_name + suffix
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(SQLitePersistence._get_archive_directory(),
+                      ignore_errors=True)
+        shutil.rmtree(SQLitePersistence._get_snapshot_directory(),
+                      ignore_errors=True)
+
+    @classmethod
+    def _get_project_catalogue(cls):
+        catalogue = SQLitePersistence._projects
+
+        # One row tells whether another process wrote projects since the
+        # catalogue was loaded
         con = SQLitePersistence._get_connection()
         cur = con.cursor()
+        stored_version = SQLitePersistence._get_stored_projects_version(cur)
+        catalogue.check_stored_version(stored_version)
 
-        cur.execute(query, (project_id,))
-        result = cur.fetchone()
+        while not catalogue.is_loaded():
+            version = catalogue.version
+            stored_version = (
+                SQLitePersistence._get_stored_projects_version(cur))
+            cur.execute("SELECT * FROM projects;")
 
-        if result is None:
-            return None
-        else:
-            project = Project(name=result[1], id=result[0])
-            return project
+            catalogue.load(
+                [Project(name=result[1], id=result[0]) for result in cur],
+                version, stored_version)
+
+        return catalogue
 
     @classmethod
-    def get_project_by_name(cls, project_name):
-        query = "SELECT * FROM projects WHERE name = ?;"
-        con = SQLitePersistence._get_connection()
-        cur = con.cursor()
+    def _get_stored_projects_version(cls, cur):
+        cur.execute("SELECT version FROM projects_version;")
+        return cur.fetchone()[0]
 
-        cur.execute(query, (project_name,))
-        result = cur.fetchone()
+    @classmethod
+    def _bump_projects_version(cls, cur):
+        cur.execute("UPDATE projects_version SET version = version + 1;")
+        return SQLitePersistence._get_stored_projects_version(cur)
 
-        if result is None:
-            return None
-        else:
-            project = Project(name=result[1], id=result[0])
-            return project
+    @classmethod
+    def get_projects(cls):
+        return SQLitePersistence._get_project_catalogue().get_all()
+
+    @classmethod
+    def get_project(cls, project_id):
+        return SQLitePersistence._get_project_catalogue().get(project_id)
+
+    @classmethod
+    def get_project_by_name(cls, project_name):
+        catalogue = SQLitePersistence._get_project_catalogue()
+        return catalogue.get_by_name(project_name)
 
     @classmethod
     def create_project(cls, project_name):
@@ -164,9 +434,11 @@ class SQLitePersistence(PersistenceBaseClass):
             """INSERT INTO projects (name) VALUES (?) """,
             (project_name,)
         )
+        p = Project(name=project_name, id=cur.lastrowid)
+        stored_version = SQLitePersistence._bump_projects_version(cur)
         con.commit()
 
-        p = Project(name=project_name, id=cur.lastrowid)
+        SQLitePersistence._projects.put(p, stored_version)
         return p
 
     @classmethod
@@ -181,15 +453,51 @@ class SQLitePersistence(PersistenceBaseClass):
             """,
             (new_name, project.id)
         )
+        stored_version = SQLitePersistence._bump_projects_version(cur)
         con.commit()
 
+        SQLitePersistence._projects.put(
+            Project(name=new_name, id=project.id), stored_version)
+
     @classmethod
     def delete_project(cls, project):
-        query = "DELETE FROM projects WHERE id = ?;"
+        """Deletes the project with its sessions and rollups.
+
+        Archived sessions stay in their files, but as project ids are
+        never reused no other project ever reads them.
+        """
         con = SQLitePersistence._get_connection()
         cur = con.cursor()
-        cur.execute(query, (project.id,))
-        con.commit()
+
+        # Foreign keys aren't enforced, so the sessions are deleted here,
+        # and the listeners told, instead of by ON DELETE CASCADE
+        cur.execute("BEGIN;")
+        try:
+            cur.execute(
+                "SELECT * FROM sessions WHERE project_id = ?;", (project.id,))
+            old_rows = cur.fetchall()
+            cur.execute(
+                "DELETE FROM sessions WHERE project_id = ?;", (project.id,))
+            cur.execute("DELETE FROM projects WHERE id = ?;", (project.id,))
+            cur.execute(
+                "DELETE FROM daily_totals WHERE project_id = ?;",
+                (project.id,))
+            stored_version = SQLitePersistence._bump_projects_version(cur)
+
+            version = None
+            if old_rows:
+                version = SQLitePersistence._commit_session_changes(
+                    con, [(row, None) for row in old_rows])
+            else:
+                con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+
+        SQLitePersistence._projects.remove(project.id, stored_version)
+        SQLitePersistence._ranges.invalidate_project(project.id)
+        if version is not None:
+            SQLitePersistence._ranges.advance(version)
 
     @classmethod
     def create_session(cls, project_id, start_=None, end_=None):
@@ -198,30 +506,108 @@ class SQLitePersistence(PersistenceBaseClass):
 
         start = None
         if start_ is None:
-            start = (datetime.now()
-                     .replace(microsecond=0)
-                     .strftime("%Y-%m-%d %H:%M:%S"))
+            start = to_timestamp(datetime.now())
         else:
-            start = (start_
-                     .replace(microsecond=0)
-                     .strftime("%Y-%m-%d %H:%M:%S"))
+            start = to_timestamp(start_)
 
+        end = None
         if end_ is None:
             cur.execute(
                 """INSERT INTO sessions (start, project_id) VALUES (?, ?) """,
                 (start, project_id)
             )
         else:
-            end = datetime.strftime(end_, "%Y-%m-%d %H:%M:%S")
+            end = to_timestamp(end_)
             cur.execute(
                 """INSERT INTO sessions (start, end, project_id)
                     VALUES (?, ?, ?) """,
                 (start, end, project_id))
 
         id = cur.lastrowid
-        con.commit()
+        SQLitePersistence._update_rollups(
+            cur, SQLitePersistence._session_by_id, (id,))
+        version = SQLitePersistence._commit_session_changes(
+            con, [(None, (id, start, end, project_id))])
+
+        SQLitePersistence._invalidate_sessions([(project_id, start, end)],
+                                               version)
         return SQLitePersistence.get_session(id)
 
+    @classmethod
+    def create_sessions(cls, sessions, read_back=False):
+        """Inserts many (project_id, start, end) sessions in one transaction.
+
+        sessions may be any iterable, including a generator, and is
+        consumed lazily; end may be None for an open session. Returns the
+        range of assigned ids, or with read_back the created Sessions.
+        """
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        rows = (
+            (to_timestamp(start),
+             None if end is None else to_timestamp(end),
+             project_id)
+            for project_id, start, end in sessions
+        )
+
+        # The write lock is held from here on, so the new rows get the
+        # consecutive ids following the last one handed out, which may
+        # have been archived or deleted since
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            cur.execute("""
+                SELECT MAX(
+                    COALESCE(MAX(id), 0),
+                    COALESCE((SELECT seq FROM sqlite_sequence
+                              WHERE name = 'sessions'), 0))
+                FROM sessions;
+            """)
+            first_id = cur.fetchone()[0] + 1
+
+            cur.executemany(
+                """INSERT INTO sessions (start, end, project_id)
+                    VALUES (?, ?, ?) """,
+                rows)
+            ids = range(first_id, first_id + cur.rowcount)
+
+            if ids:
+                SQLitePersistence._update_rollups(cur, """
+                    SELECT project_id, start, end FROM sessions
+                    WHERE id BETWEEN ? AND ?
+                """, (ids[0], ids[-1]))
+
+            if ids:
+                version = SQLitePersistence._commit_session_changes(
+                    con, lambda: [(None, row) for row in cur.execute(
+                        "SELECT * FROM sessions WHERE id BETWEEN ? AND ?;",
+                        (ids[0], ids[-1]))])
+            else:
+                con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+
+        if ids:
+            cur.execute("""
+                SELECT project_id, MIN(start), MAX(start)
+                FROM sessions WHERE
+                id BETWEEN ? AND ?
+                GROUP BY project_id;
+            """, (ids[0], ids[-1]))
+            for project_id, first_start, last_start in cur.fetchall():
+                SQLitePersistence._ranges.invalidate(
+                    project_id, [(first_start, last_start)])
+            SQLitePersistence._ranges.advance(version)
+
+        if not read_back:
+            return ids
+
+        cur.execute(
+            "SELECT * FROM sessions WHERE id BETWEEN ? AND ? ORDER BY id;",
+            (first_id, first_id + len(ids) - 1))
+        return [Session.from_sql_result(result) for result in cur]
+
     @classmethod
     def get_session(cls, session_id):
         query = "SELECT * FROM sessions WHERE id = ?;"
@@ -237,23 +623,60 @@ class SQLitePersistence(PersistenceBaseClass):
             return Session.from_sql_result(result)
 
     @classmethod
-    def get_sessions(cls, project_id, from_, to):
+    def get_sessions(cls, project_id, from_, to, as_batch=False):
+        """Returns the sessions starting in the range, ordered by start.
+
+        With as_batch a compact SessionBatch is returned instead of a list
+        of Session objects.
+        """
         query = """
             SELECT * FROM sessions WHERE
             project_id = ?
             AND start BETWEEN ? AND ?
+            ORDER BY start, id
         """
 
-        query_from = from_.strftime("%Y-%m-%d %H:%M:%S")
-        query_to = to.strftime("%Y-%m-%d %H:%M:%S")
+        query_from = to_timestamp(from_)
+        query_to = to_timestamp(to)
 
-        con = SQLitePersistence._get_connection()
-        cur = con.cursor()
+        if as_batch:
+            # Analytic callers may ask for years of sessions: rows go
+            # straight from the cursor into the batch's columns, and
+            # aren't cached
+            archived = SQLitePersistence._get_archive().iter_rows(
+                project_id, query_from, query_to)
+
+            con = SQLitePersistence._get_connection()
+            cur = con.cursor()
+            cur.execute(query, (project_id, query_from, query_to))
+
+            return SessionBatch.from_sql_results(heapq.merge(
+                archived, cur, key=lambda row: (row[1], row[0])))
 
-        cur.execute(query, (project_id, query_from, query_to))
+        cache = SQLitePersistence._ranges
+        cache.check_version(SQLitePersistence.get_session_version())
+        key = ("sessions", project_id, query_from, query_to)
+        generation = cache.generation
 
-        results = cur.fetchall()
+        results = cache.get(key)
+        if results is None:
+            archived = SQLitePersistence._get_archive().get_rows(
+                project_id, query_from, query_to)
 
+            con = SQLitePersistence._get_connection()
+            cur = con.cursor()
+
+            cur.execute(query, (project_id, query_from, query_to))
+
+            results = cur.fetchall()
+            if archived:
+                results = list(heapq.merge(
+                    archived, results, key=lambda row: (row[1], row[0])))
+
+            cache.put(key, project_id, query_from, query_to, results,
+                      generation, rows=len(results))
+
+        # Sessions are mutable, so each call gets its own
         sessions = []
         for result in results:
             s = Session.from_sql_result(result)
@@ -262,18 +685,723 @@ class SQLitePersistence(PersistenceBaseClass):
         return sessions
 
     @classmethod
-    def update_session(cls, updated_session):
+    def get_sessions_page(cls, project_id, from_, to, after=None, limit=100):
+        """Returns the next page of sessions starting in the range.
+
+        Sessions are ordered by (start, id). Pass the last session of the
+        previous page as after to get the page following it; the query
+        seeks straight to it through the index, so later pages cost as
+        little as the first.
+        """
+        query = """
+            SELECT * FROM sessions WHERE
+            project_id = ?
+            AND start BETWEEN ? AND ?
+            AND (start, id) > (?, ?)
+            ORDER BY start, id
+            LIMIT ?
+        """
+
+        query_from = to_timestamp(from_)
+        query_to = to_timestamp(to)
+
+        after_start = query_from
+        after_id = -1
+        if after is not None:
+            after_start = to_timestamp(after.start)
+            after_id = after.id
+            # Lets the index range begin at the cursor
+            query_from = max(query_from, after_start)
+
+        # Archived sessions after the cursor, at most a page of them
+        archived = itertools.islice(
+            (row for row in SQLitePersistence._get_archive().iter_rows(
+                project_id, query_from, query_to)
+             if (row[1], row[0]) > (after_start, after_id)),
+            limit)
+
         con = SQLitePersistence._get_connection()
         cur = con.cursor()
 
-        updated_start = updated_session.start.strftime("%Y-%m-%d %H:%M:%S")
+        cur.execute(query, (project_id, query_from, query_to,
+                            after_start, after_id, limit))
+
+        rows = heapq.merge(archived, cur, key=lambda row: (row[1], row[0]))
+        return [Session.from_sql_result(result)
+                for result in itertools.islice(rows, limit)]
+
+    @classmethod
+    def iter_sessions(cls, project_id, from_, to, batch_size=500):
+        """Yields the sessions starting in the range, ordered by start.
+
+        Sessions are fetched batch_size at a time, so memory use stays
+        flat however large the range is.
+        """
+        page = SQLitePersistence.get_sessions_page(
+            project_id, from_, to, limit=batch_size)
+
+        while page:
+            yield from page
+            if len(page) < batch_size:
+                return
+            page = SQLitePersistence.get_sessions_page(
+                project_id, from_, to, after=page[-1], limit=batch_size)
+
+    @classmethod
+    def _session_filter(cls, project_ids=None, from_=None, to=None,
+                        status=None):
+        """Builds the WHERE clause shared by the export queries.
+
+        project_ids limits the projects (all of them if None), from_ and
+        to the start of the sessions, and status is None, "open" or
+        "closed".
+        """
+        clauses = []
+        params = []
+
+        if project_ids is not None:
+            project_ids = list(project_ids)
+            placeholders = ", ".join("?" * len(project_ids))
+            clauses.append(f"sessions.project_id IN ({placeholders})")
+            params.extend(project_ids)
+        if from_ is not None:
+            clauses.append("sessions.start >= ?")
+            params.append(to_timestamp(from_))
+        if to is not None:
+            clauses.append("sessions.start <= ?")
+            params.append(to_timestamp(to))
+
+        match status:
+            case None:
+                pass
+            case "open":
+                clauses.append("sessions.end IS NULL")
+            case "closed":
+                clauses.append("sessions.end IS NOT NULL")
+            case _:
+                raise ValueError(f"Unknown session status: {status}")
+
+        return (" AND ".join(clauses) or "1", params)
+
+    @classmethod
+    def _archived_project_ids(cls, project_ids, status):
+        """Returns the sorted ids of the projects whose archived sessions
+        pass the export filters."""
+        # Archived sessions are all closed
+        if status == "open":
+            return []
+
+        if project_ids is None:
+            # Like the live query's join, skips deleted projects
+            archive = SQLitePersistence._get_archive()
+            return sorted(
+                project_id for project_id in archive.get_project_ids()
+                if SQLitePersistence.get_project(project_id) is not None)
+        return sorted(set(project_ids))
+
+    @classmethod
+    def _archive_bounds(cls, from_, to):
+        lo = float("-inf") if from_ is None else to_timestamp(from_)
+        hi = float("inf") if to is None else to_timestamp(to)
+        return (lo, hi)
+
+    @classmethod
+    def count_sessions(cls, project_ids=None, from_=None, to=None,
+                       status=None):
+        where, params = SQLitePersistence._session_filter(
+            project_ids, from_, to, status)
 
-        updated_end = ""
+        archive = SQLitePersistence._get_archive()
+        lo, hi = SQLitePersistence._archive_bounds(from_, to)
+        archived = sum(
+            archive.count(project_id, lo, hi)
+            for project_id in SQLitePersistence._archived_project_ids(
+                project_ids, status))
 
-        if updated_session.end is None:
-            updated_end = None
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM sessions WHERE {where}", params)
+        return cur.fetchone()[0] + archived
+
+    @classmethod
+    def iter_session_records(cls, project_ids=None, from_=None, to=None,
+                             status=None, batch_size=1000):
+        """Yields (id, project name, start, end, seconds) tuples.
+
+        start and end are formatted by SQLite as "YYYY-MM-DD HH:MM:SS"
+        local time, end is "" for open sessions, whose seconds count up to
+        now. Rows come out grouped by project and ordered by start, read
+        from one cursor batch_size at a time, so no Session objects are
+        built and memory use doesn't grow with the number of sessions.
+        Archived sessions are merged in from their files the same way.
+        """
+        where, params = SQLitePersistence._session_filter(
+            project_ids, from_, to, status)
+
+        archived = SQLitePersistence._iter_archived_records(
+            SQLitePersistence._archived_project_ids(project_ids, status),
+            *SQLitePersistence._archive_bounds(from_, to))
+
+        # Ordered like the (project_id, start) index, so SQLite never has
+        # to sort. The project and epoch start lead each row for merging
+        # with the archive.
+        query = f"""
+            SELECT
+                sessions.project_id,
+                sessions.start,
+                sessions.id,
+                projects.name,
+                strftime('%Y-%m-%d %H:%M:%S', sessions.start, 'unixepoch',
+                         'localtime'),
+                COALESCE(strftime('%Y-%m-%d %H:%M:%S', sessions.end,
+                                  'unixepoch', 'localtime'), ''),
+                MAX(COALESCE(sessions.end, ?) - sessions.start, 0)
+            FROM sessions
+            JOIN projects ON projects.id = sessions.project_id
+            WHERE {where}
+            ORDER BY sessions.project_id, sessions.start, sessions.id
+        """
+
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+        cur.execute(query, [to_timestamp(datetime.now())] + params)
+
+        def fetch():
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+
+        for row in heapq.merge(archived, fetch(), key=lambda row: row[:3]):
+            yield row[2:]
+
+    @classmethod
+    def _iter_archived_records(cls, project_ids, lo, hi):
+        """Yields archived sessions like the iter_session_records query,
+        with the project id and epoch start in front."""
+        archive = SQLitePersistence._get_archive()
+        for project_id in project_ids:
+            project = SQLitePersistence.get_project(project_id)
+            if project is None:
+                continue
+
+            for id, start, end, _ in archive.iter_rows(project_id, lo, hi):
+                yield (project_id, start, id, project.name,
+                       _format_local(start), _format_local(end),
+                       max(end - start, 0))
+
+    @classmethod
+    def get_session_starts(cls, project_id, from_, to):
+        """Returns the set of epoch starts of the project's sessions in
+        the range, live ones read from the index alone."""
+        lo, hi = to_timestamp(from_), to_timestamp(to)
+        starts = {row[1] for row in SQLitePersistence._get_archive().iter_rows(
+            project_id, lo, hi)}
+
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+        cur.execute("""
+            SELECT start FROM sessions WHERE
+            project_id = ?
+            AND start BETWEEN ? AND ?
+        """, (project_id, lo, hi))
+        starts.update(start for start, in cur)
+        return starts
+
+    @classmethod
+    def get_total_duration(cls, project_id, from_, to):
+        """Returns the seconds logged by sessions starting in the range.
+
+        Open sessions count up to now. Computed inside SQLite, so no
+        Session objects are built.
+        """
+        totals = SQLitePersistence.get_total_durations(
+            project_id, [("total", from_, to)])
+        return totals["total"]
+
+    @classmethod
+    def get_total_durations(cls, project_id, windows):
+        """Returns {name: Duration} for a list of (name, from_, to) windows.
+
+        All windows are summed in a single scan over the rows spanned by
+        the outermost window, e.g. today, this week and this month are
+        answered by reading this month's sessions once.
+        """
+        if not windows:
+            return {}
+
+        names = []
+        bounds = []
+        for name, from_, to in windows:
+            names.append(name)
+            bounds.append((to_timestamp(from_), to_timestamp(to)))
+
+        now = to_timestamp(datetime.now())
+        query_from = min(lo for lo, hi in bounds)
+        query_to = max(hi for lo, hi in bounds)
+
+        cache = SQLitePersistence._ranges
+        cache.check_version(SQLitePersistence.get_session_version())
+        key = ("totals", project_id, tuple(bounds))
+        generation = cache.generation
+
+        cached = cache.get(key)
+        if cached is None:
+            totals, open_counts, has_future_open = (
+                SQLitePersistence._query_total_durations(
+                    project_id, bounds, now, query_from, query_to))
+
+            archive = SQLitePersistence._get_archive()
+            totals = [total + archive.get_total(project_id, lo, hi)
+                      for total, (lo, hi) in zip(totals, bounds)]
+
+            # Open sessions grow by one second per second, which can be
+            # added on later reads as long as none of them starts after
+            # now (those count as 0 until they start)
+            if not has_future_open:
+                cache.put(key, project_id, query_from, query_to,
+                          (totals, open_counts, now), generation)
         else:
-            updated_end = updated_session.end.strftime("%Y-%m-%d %H:%M:%S")
+            totals, open_counts, then = cached
+            totals = [total + open_count * (now - then)
+                      for total, open_count in zip(totals, open_counts)]
+
+        return {name: Duration(total) for name, total in zip(names, totals)}
+
+    @classmethod
+    def _query_total_durations(cls, project_id, bounds, now, query_from,
+                               query_to):
+        columns = []
+        params = []
+        for lo, hi in bounds:
+            columns.append(
+                "COALESCE(SUM(CASE WHEN start BETWEEN ? AND ? "
+                "THEN duration END), 0)")
+            columns.append(
+                "COALESCE(SUM(CASE WHEN start BETWEEN ? AND ? "
+                "THEN is_open END), 0)")
+            params.extend((lo, hi, lo, hi))
+
+        query = f"""
+            SELECT
+                {", ".join(columns)},
+                COALESCE(MAX(is_open AND start > ?), 0)
+            FROM (
+                SELECT
+                    start,
+                    MAX(COALESCE(end, ?) - start, 0) AS duration,
+                    end IS NULL AS is_open
+                FROM sessions WHERE
+                project_id = ?
+                AND start BETWEEN ? AND ?
+            )
+        """
+
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        cur.execute(
+            query,
+            (*params, now, now, project_id, query_from, query_to))
+
+        result = cur.fetchone()
+        return (list(result[0:-1:2]), list(result[1:-1:2]), result[-1])
+
+    @classmethod
+    def _with_day_pieces(cls, seed):
+        """Returns a WITH clause that cuts sessions at local midnight.
+
+        seed selects (project_id, lo, hi) epoch intervals. The resulting
+        `days(project_id, day, seconds)` table has one row per interval
+        and local 'YYYY-MM-DD' day it touches.
+        """
+        # Epoch seconds of the local midnight following `lo`
+        next_midnight = """
+            CAST(strftime('%s', lo, 'unixepoch', 'localtime',
+                          'start of day', '+1 day', 'utc') AS INTEGER)
+        """
+
+        return f"""
+            WITH RECURSIVE pieces(project_id, lo, hi) AS (
+                {seed}
+                UNION ALL
+                SELECT project_id, {next_midnight}, hi FROM pieces
+                WHERE {next_midnight} < hi
+            ),
+            days(project_id, day, seconds) AS (
+                SELECT
+                    project_id,
+                    date(lo, 'unixepoch', 'localtime'),
+                    MIN(hi, {next_midnight}) - lo
+                FROM pieces
+            )
+        """
+
+    # Maps a local 'YYYY-MM-DD' day to the first day of its period
+    _period_buckets = {
+        "day": "day",
+        "week": """date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER)
+                                      + 6) % 7) || ' days')""",
+        "month": "strftime('%Y-%m-01', day)",
+    }
+
+    @classmethod
+    def get_period_totals(cls, period, from_, to, project_id=None):
+        """Returns (period_start, project_id, seconds) rows per period.
+
+        period is "day", "week" (starting on Monday) or "month", and the
+        from_/to dates are inclusive. Sessions are cut at local midnight
+        so time is booked to the day it was spent on, and open sessions
+        count up to now. Leave out project_id to report on all projects.
+
+        Closed sessions are read from the daily_totals rollup; only open
+        sessions are split on the fly.
+        """
+        bucket = SQLitePersistence._period_buckets[period]
+
+        project_filter = ""
+        if project_id is not None:
+            project_filter = "AND project_id = :project_id"
+
+        open_pieces = SQLitePersistence._with_day_pieces(f"""
+            SELECT project_id, MAX(start, :lo), MIN(:now, :hi)
+            FROM sessions WHERE
+            end IS NULL
+            AND start < :hi
+            AND :now > MAX(start, :lo)
+            {project_filter}
+        """)
+
+        query = f"""
+            {open_pieces},
+            all_days(project_id, day, seconds) AS (
+                SELECT project_id, day, seconds FROM days
+                UNION ALL
+                SELECT project_id, day, seconds FROM daily_totals WHERE
+                day BETWEEN :from_day AND :to_day
+                {project_filter}
+            )
+            SELECT {bucket} AS period, project_id, SUM(seconds) AS total
+            FROM all_days
+            GROUP BY period, project_id
+            HAVING total > 0
+            ORDER BY period, project_id;
+        """
+
+        params = {
+            "lo": to_timestamp(from_),
+            "hi": to_timestamp(to + timedelta(days=1)),
+            "now": to_timestamp(datetime.now()),
+            "from_day": from_.isoformat(),
+            "to_day": to.isoformat(),
+            "project_id": project_id,
+        }
+
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        cur.execute(query, params)
+
+        return cur.fetchall()
+
+    @classmethod
+    def _update_rollups(cls, cur, sessions_query, params, sign=1):
+        """Adds (or with sign=-1 removes) sessions to the daily rollup.
+
+        sessions_query selects the (project_id, start, end) of the closed
+        sessions to apply.
+        """
+        day_pieces = SQLitePersistence._with_day_pieces(f"""
+            SELECT project_id, start, end FROM ({sessions_query})
+            WHERE end > start
+        """)
+
+        cur.execute(f"""
+            {day_pieces}
+            INSERT INTO daily_totals (project_id, day, seconds)
+            SELECT project_id, day, {sign} * SUM(seconds)
+            FROM days WHERE true
+            GROUP BY project_id, day
+            ON CONFLICT (project_id, day)
+            DO UPDATE SET seconds = seconds + excluded.seconds;
+        """, params)
+
+        if sign < 0:
+            cur.execute(f"""
+                DELETE FROM daily_totals WHERE
+                seconds = 0
+                AND project_id IN (SELECT project_id FROM ({sessions_query}))
+            """, params)
+
+    _session_by_id = "SELECT project_id, start, end FROM sessions WHERE id = ?"
+
+    @classmethod
+    def _create_rollups(cls, cur):
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS daily_totals (
+                project_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                seconds INTEGER NOT NULL,
+                PRIMARY KEY (project_id, day)
+            ) WITHOUT ROWID;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS daily_totals_day
+            ON daily_totals (day, project_id, seconds);
+        """)
+
+        cur.execute("DELETE FROM daily_totals;")
+        SQLitePersistence._update_rollups(cur, """
+            SELECT project_id, start, end FROM sessions
+            WHERE project_id IN (SELECT id FROM projects)
+        """, ())
+
+    @classmethod
+    def rebuild_rollups(cls):
+        """Recomputes daily_totals from the sessions table and archive.
+
+        Repairs drift, e.g. after the local timezone changed or sessions
+        were edited outside the persistence layer.
+        """
+        archive = SQLitePersistence._get_archive()
+
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+        cur.execute("BEGIN;")
+        SQLitePersistence._create_rollups(cur)
+
+        # Archived sessions go through a temporary table one file at a
+        # time, so the rollup query can split them like live ones
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS archived_sessions (
+                project_id INTEGER, start INTEGER, end INTEGER);
+        """)
+        for file in archive.get_files():
+            cur.executemany(
+                "INSERT INTO archived_sessions VALUES (?, ?, ?);",
+                file.iter_rows())
+            SQLitePersistence._update_rollups(cur, """
+                SELECT project_id, start, end FROM temp.archived_sessions
+                WHERE project_id IN (SELECT id FROM projects)
+            """, ())
+            cur.execute("DELETE FROM archived_sessions;")
+        con.commit()
+
+    @classmethod
+    def _create_archive_table(cls, cur):
+        # The archive files that hold sessions moved out of the sessions
+        # table. A file only counts once it is listed here, which happens
+        # in the same transaction that deletes its sessions.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS archive_files (
+                name TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                min_start INTEGER NOT NULL,
+                max_start INTEGER NOT NULL
+            );
+        """)
+
+    @classmethod
+    def _create_session_version(cls, cur):
+        # A counter bumped by every session write, so derived data kept
+        # on disk (see snapshot.py) can tell whether it is still current
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS session_version (
+                version INTEGER NOT NULL
+            );
+        """)
+        cur.execute("INSERT INTO session_version VALUES (0);")
+
+    @classmethod
+    def _never_reuse_session_ids(cls, cur):
+        # Archiving deletes sessions from the table, and SQLite would hand
+        # their ids out again to new sessions. With AUTOINCREMENT ids only
+        # grow; the sequence starts above every archived id.
+        cur.execute("""
+            CREATE TABLE sessions_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                start INTEGER NOT NULL,
+                end INTEGER,
+                project_id  INTEGER NOT NULL,
+                FOREIGN KEY (project_id)
+                REFERENCES projects (id)
+                ON UPDATE CASCADE
+                ON DELETE CASCADE
+            );
+        """)
+        cur.execute("""
+            INSERT INTO sessions_new (id, start, end, project_id)
+            SELECT id, start, end, project_id FROM sessions;
+        """)
+        cur.execute("DROP TABLE sessions;")
+        cur.execute("ALTER TABLE sessions_new RENAME TO sessions;")
+
+        SQLitePersistence._create_session_indexes(cur)
+
+        names = [name for name, in cur.execute(
+            "SELECT name FROM archive_files;").fetchall()]
+        archive = SessionArchive(SQLitePersistence._get_archive_directory())
+        archive.open(names)
+        try:
+            last_id = max((max(file.ids, default=0)
+                           for file in archive.get_files()), default=0)
+        finally:
+            archive.close()
+
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM sessions;")
+        last_id = max(last_id, cur.fetchone()[0])
+        cur.execute("DELETE FROM sqlite_sequence WHERE name = 'sessions';")
+        cur.execute("INSERT INTO sqlite_sequence VALUES ('sessions', ?);",
+                    (last_id,))
+
+    @classmethod
+    def _never_reuse_project_ids(cls, cur):
+        # Archived sessions outlive their deleted project, and a new
+        # project given the same id would inherit them. Sessions left
+        # behind by earlier deletes are dropped.
+        for table in ("sessions", "daily_totals"):
+            cur.execute(f"""
+                DELETE FROM {table} WHERE
+                project_id NOT IN (SELECT id FROM projects);
+            """)
+        cur.execute("""
+            CREATE TABLE projects_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            );
+        """)
+        cur.execute("""
+            INSERT INTO projects_new (id, name)
+            SELECT id, name FROM projects;
+        """)
+        cur.execute("DROP TABLE projects;")
+        cur.execute("ALTER TABLE projects_new RENAME TO projects;")
+
+        names = [name for name, in cur.execute(
+            "SELECT name FROM archive_files;").fetchall()]
+        archive = SessionArchive(SQLitePersistence._get_archive_directory())
+        archive.open(names)
+        try:
+            last_id = max(archive.get_project_ids(), default=0)
+        finally:
+            archive.close()
+
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM projects;")
+        last_id = max(last_id, cur.fetchone()[0])
+        cur.execute("DELETE FROM sqlite_sequence WHERE name = 'projects';")
+        cur.execute("INSERT INTO sqlite_sequence VALUES ('projects', ?);",
+                    (last_id,))
+
+    @classmethod
+    def _create_projects_version(cls, cur):
+        # Like session_version, for project writes, so the project
+        # catalogue notices projects written by other processes
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS projects_version (
+                version INTEGER NOT NULL
+            );
+        """)
+        cur.execute("INSERT INTO projects_version VALUES (0);")
+
+    @classmethod
+    def _get_archive_directory(cls):
+        return SQLitePersistence._db_name + ".archive"
+
+    @classmethod
+    def _get_snapshot_directory(cls):
+        return SQLitePersistence._db_name + ".snapshot"
+
+    @classmethod
+    def _get_archive(cls):
+        with SQLitePersistence._archive_lock:
+            if SQLitePersistence._archive is None:
+                con = SQLitePersistence._get_connection()
+                names = [name for name, in con.execute(
+                    "SELECT name FROM archive_files ORDER BY name;")]
+
+                archive = SessionArchive(
+                    SQLitePersistence._get_archive_directory())
+                archive.open(names)
+                SQLitePersistence._archive = archive
+            return SQLitePersistence._archive
+
+    @classmethod
+    def archive_sessions(cls, cutoff):
+        """Moves the closed sessions starting before cutoff to a new
+        archive file and returns how many were moved.
+
+        Archived sessions keep showing up in get_sessions, totals and
+        reports (their rollups stay in place), but can no longer be
+        edited or deleted.
+        """
+        archive = SQLitePersistence._get_archive()
+        cutoff = to_timestamp(cutoff)
+
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        # Nothing can be written between reading the sessions and
+        # deleting them
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            cur.execute("""
+                SELECT COUNT(*) FROM sessions WHERE
+                end IS NOT NULL
+                AND start < ?
+            """, (cutoff,))
+            if not cur.fetchone()[0]:
+                con.rollback()
+                return 0
+
+            # Files are numbered in the order they were archived. A file
+            # already on disk but not listed was left by an archiving
+            # that never committed, and its number is skipped.
+            cur.execute("SELECT COALESCE(MAX(rowid), 0) FROM archive_files;")
+            number = cur.fetchone()[0] + 1
+            while archive.exists(f"sessions-{number:08d}.dta"):
+                number += 1
+            name = f"sessions-{number:08d}.dta"
+
+            cur.execute("""
+                SELECT id, start, end, project_id FROM sessions WHERE
+                end IS NOT NULL
+                AND start < ?
+                ORDER BY project_id, start, id
+            """, (cutoff,))
+            count, min_start, max_start = archive.write(name, cur)
+
+            try:
+                cur.execute(
+                    "INSERT INTO archive_files VALUES (?, ?, ?, ?);",
+                    (name, count, min_start, max_start))
+                cur.execute("""
+                    DELETE FROM sessions WHERE
+                    end IS NOT NULL
+                    AND start < ?
+                """, (cutoff,))
+                con.commit()
+            except BaseException:
+                archive.discard(name)
+                raise
+        except BaseException:
+            con.rollback()
+            raise
+
+        archive.add(name)
+        SQLitePersistence._ranges.clear()
+        return count
+
+    @classmethod
+    def update_session(cls, updated_session):
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        updated_start = to_timestamp(updated_session.start)
+
+        updated_end = None
+        if updated_session.end is not None:
+            updated_end = to_timestamp(updated_session.end)
 
         query = """
             UPDATE sessions
@@ -284,16 +1412,66 @@ class SQLitePersistence(PersistenceBaseClass):
         values = (updated_session.project_id, updated_start,
                   updated_end, updated_session.id)
 
+        session_by_id = SQLitePersistence._session_by_id
+
+        cur.execute("BEGIN;")
+        old_row = SQLitePersistence._get_session_row(cur, updated_session.id)
+        SQLitePersistence._update_rollups(
+            cur, session_by_id, (updated_session.id,), sign=-1)
         cur.execute(query, values)
-        con.commit()
+        SQLitePersistence._update_rollups(
+            cur, session_by_id, (updated_session.id,))
+
+        # Deleted sessions aren't in the table to update
+        if old_row is None:
+            con.rollback()
+            SQLitePersistence._check_not_archived(updated_session.id)
+        else:
+            old_project_id, old_start, old_end = old_row
+            version = SQLitePersistence._commit_session_changes(con, [(
+                (updated_session.id, old_start, old_end, old_project_id),
+                (updated_session.id, updated_start, updated_end,
+                 updated_session.project_id))])
+
+        if old_row is not None:
+            SQLitePersistence._invalidate_sessions(
+                [old_row, (updated_session.project_id, updated_start,
+                           updated_end)], version)
 
     @classmethod
     def delete_session(cls, session):
         query = "DELETE FROM sessions WHERE id = ?;"
         con = SQLitePersistence._get_connection()
         cur = con.cursor()
+        cur.execute("BEGIN;")
+        old_row = SQLitePersistence._get_session_row(cur, session.id)
+        SQLitePersistence._update_rollups(
+            cur, SQLitePersistence._session_by_id, (session.id,), sign=-1)
         cur.execute(query, (session.id,))
-        con.commit()
+
+        if old_row is None:
+            con.rollback()
+            SQLitePersistence._check_not_archived(session.id)
+        else:
+            old_project_id, old_start, old_end = old_row
+            version = SQLitePersistence._commit_session_changes(con, [(
+                (session.id, old_start, old_end, old_project_id), None)])
+
+        if old_row is not None:
+            SQLitePersistence._invalidate_sessions([old_row], version)
+
+    @classmethod
+    def _check_not_archived(cls, session_id):
+        if SQLitePersistence._get_archive().has_session(session_id):
+            raise ValueError(
+                f"Session {session_id} is archived and can't be changed")
+
+    @classmethod
+    def get_archived_session_ids(cls, project_id, from_, to):
+        """Returns the ids of the archived sessions that get_sessions
+        returns for the range, which can't be edited or deleted."""
+        return {row[0] for row in SQLitePersistence._get_archive().iter_rows(
+            project_id, to_timestamp(from_), to_timestamp(to))}
 
     @classmethod
     def get_open_session(cls, project_id):
@@ -314,3 +1492,19 @@ class SQLitePersistence(PersistenceBaseClass):
             return None
         else:
             return Session.from_sql_result(result)
+
+    @classmethod
+    def get_tracking_project_ids(cls):
+        """Returns the set of ids of projects that have an open session."""
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        cur.execute(
+            "SELECT DISTINCT project_id FROM sessions WHERE end IS NULL;")
+
+        return {result[0] for result in cur}
+
+
+def _format_local(timestamp):
+    # Matches SQLite's strftime('%Y-%m-%d %H:%M:%S', ..., 'localtime')
+    return from_timestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
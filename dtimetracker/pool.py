@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import time
+
+
+class ConnectionPool:
+    """Hands every thread its own SQLite connection.
+
+    Connections are opened lazily and at most max_size exist at once. A
+    thread keeps its connection until it calls release() or exits; the
+    connection is then reused by the next thread that asks for one. When
+    all connections are taken, get() waits up to timeout seconds.
+    """
+
+    def __init__(self, db_name, setup=None, max_size=8, timeout=10.0):
+        self.db_name = db_name
+        self.setup = setup
+        self.max_size = max_size
+        self.timeout = timeout
+
+        self._condition = threading.Condition()
+        self._in_use = {}
+        self._idle = []
+
+    def get(self):
+        thread = threading.current_thread()
+
+        with self._condition:
+            con = self._in_use.get(thread)
+            if con is not None:
+                return con
+
+            deadline = time.monotonic() + self.timeout
+            while not self._idle and len(self._in_use) >= self.max_size:
+                self._reclaim_finished_threads()
+                if self._idle:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"All {self.max_size} database connections are "
+                        "in use")
+
+                # Exiting threads don't notify, so check back regularly
+                self._condition.wait(min(remaining, 0.05))
+
+            if self._idle:
+                con = self._idle.pop()
+            else:
+                con = self._connect()
+
+            self._in_use[thread] = con
+            return con
+
+    def release(self):
+        """Returns the calling thread's connection to the pool."""
+        thread = threading.current_thread()
+
+        with self._condition:
+            con = self._in_use.pop(thread, None)
+            if con is None:
+                return
+
+            if con.in_transaction:
+                con.rollback()
+            self._idle.append(con)
+            self._condition.notify()
+
+    def close_all(self):
+        """Closes every connection, including those held by threads."""
+        with self._condition:
+            connections = list(self._in_use.values()) + self._idle
+            self._in_use.clear()
+            self._idle.clear()
+
+            for con in connections:
+                con.close()
+
+            self._condition.notify_all()
+
+    def size(self):
+        with self._condition:
+            return len(self._in_use) + len(self._idle)
+
+    def _connect(self):
+        # Connections move between threads, but only ever serve one
+        # thread at a time
+        con = sqlite3.connect(self.db_name, check_same_thread=False)
+        if self.setup is not None:
+            self.setup(con)
+        return con
+
+    def _reclaim_finished_threads(self):
+        for thread in list(self._in_use):
+            if not thread.is_alive():
+                con = self._in_use.pop(thread)
+                if con.in_transaction:
+                    con.rollback()
+                self._idle.append(con)
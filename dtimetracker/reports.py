@@ -0,0 +1,80 @@
+from datetime import date, datetime, timedelta
+from .core import Duration
+from .persistence import SQLitePersistence
+
+
+class ReportEngine:
+    """Per-day, per-ISO-week and per-month totals, grouped inside SQLite."""
+
+    periods = ("day", "week", "month")
+
+    @classmethod
+    def get_totals(cls, period, from_, to, project_id=None):
+        """Returns (period_start, project_id, Duration) rows.
+
+        period_start is the day, the Monday of the ISO week or the first
+        of the month. Periods in which nothing was logged are left out.
+        """
+        if period not in ReportEngine.periods:
+            raise ValueError(f"Unknown report period: {period}")
+
+        rows = SQLitePersistence.get_period_totals(
+            period, ReportEngine._as_date(from_), ReportEngine._as_date(to),
+            project_id)
+
+        return [(date.fromisoformat(period_start), pid, Duration(seconds))
+                for period_start, pid, seconds in rows]
+
+    @classmethod
+    def get_daily_totals(cls, from_, to, project_id=None):
+        return ReportEngine.get_totals("day", from_, to, project_id)
+
+    @classmethod
+    def get_weekly_totals(cls, from_, to, project_id=None):
+        return ReportEngine.get_totals("week", from_, to, project_id)
+
+    @classmethod
+    def get_monthly_totals(cls, from_, to, project_id=None):
+        return ReportEngine.get_totals("month", from_, to, project_id)
+
+    @classmethod
+    def sum_by_period(cls, rows):
+        """Folds rows of several projects into {period_start: Duration}."""
+        totals = {}
+        for period_start, _, seconds in rows:
+            totals[period_start] = (
+                totals.get(period_start, Duration()) + seconds)
+        return totals
+
+    @classmethod
+    def get_period_label(cls, period, period_start):
+        match period:
+            case "day":
+                return period_start.strftime("%a %b %d, %Y")
+            case "week":
+                year, week, _ = period_start.isocalendar()
+                return f"{year}-W{str(week).zfill(2)}"
+            case "month":
+                return period_start.strftime("%B %Y")
+
+    @classmethod
+    def get_default_range(cls, period, today=None):
+        """The last 30 days, 12 weeks or 12 months, ending today."""
+        today = today or date.today()
+        match period:
+            case "day":
+                return (today - timedelta(days=29), today)
+            case "week":
+                monday = today - timedelta(days=today.weekday())
+                return (monday - timedelta(weeks=11), today)
+            case "month":
+                first = today.replace(day=1)
+                for _ in range(11):
+                    first = (first - timedelta(days=1)).replace(day=1)
+                return (first, today)
+
+    @classmethod
+    def _as_date(cls, value):
+        if isinstance(value, datetime):
+            return value.date()
+        return value
@@ -0,0 +1,502 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import heapq
+from itertools import groupby
+import json
+import os
+import struct
+import threading
+from .archive import SessionArchive
+from .columns import MappedColumns, write_columns
+from .core import Duration, to_timestamp
+from .persistence import SQLitePersistence
+
+# magic, closed session count, open session count
+HEADER = struct.Struct("<8sQQ")
+MAGIC = b"DTTSNAP1"
+
+
+class SnapshotSegment:
+    """One memory-mapped file of a snapshot.
+
+    Closed sessions are stored as project id and start columns sorted by
+    (project_id, start), plus a column of prefix sums of their seconds:
+    the seconds of sessions i to j are prefix[j] - prefix[i]. Open
+    sessions follow as (project_id, start, sign) columns; they are few,
+    and only get their length when a query knows what now is.
+
+    A segment can also remove sessions: those have negative seconds, and
+    open ones a sign of -1.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = MappedColumns(path, HEADER, MAGIC)
+
+        _, self.count, self.open_count = self._file.header
+        self.project_ids, self.starts, self.prefix = (
+            self._file.get_columns(self.count, self.count, self.count + 1))
+        self.open_project_ids, self.open_starts, self.open_signs = (
+            self._file.get_columns(*[self.open_count] * 3))
+
+    @classmethod
+    def write(cls, path, rows, open_rows):
+        """Writes closed (project_id, start, seconds) rows, which must be
+        sorted, and open (project_id, start, sign) rows to path."""
+        project_ids = array("q")
+        starts = array("q")
+        prefix = array("q", [0])
+        total = 0
+        for project_id, start, seconds in rows:
+            project_ids.append(project_id)
+            starts.append(start)
+            total += seconds
+            prefix.append(total)
+
+        open_columns = (array("q"), array("q"), array("q"))
+        for row in open_rows:
+            for column, value in zip(open_columns, row):
+                column.append(value)
+
+        write_columns(
+            path,
+            HEADER.pack(MAGIC, len(starts), len(open_columns[0])),
+            (project_ids, starts, prefix) + open_columns)
+
+    def get_total(self, project_id, lo, hi, now):
+        # Two bisects find the project, two more its range
+        first = bisect_left(self.project_ids, project_id)
+        last = bisect_right(self.project_ids, project_id, first)
+        i = bisect_left(self.starts, lo, first, last)
+        j = bisect_right(self.starts, hi, i, last)
+        total = self.prefix[j] - self.prefix[i]
+
+        for open_project_id, start, sign in zip(
+                self.open_project_ids, self.open_starts, self.open_signs):
+            if open_project_id == project_id and lo <= start <= hi:
+                total += sign * max(now - start, 0)
+
+        return total
+
+    def iter_rows(self):
+        """Yields the closed (project_id, start, seconds) rows in order."""
+        prefix = self.prefix
+        for i, (project_id, start) in enumerate(
+                zip(self.project_ids, self.starts)):
+            yield (project_id, start, prefix[i + 1] - prefix[i])
+
+    def iter_open_rows(self):
+        return zip(self.open_project_ids, self.open_starts, self.open_signs)
+
+    def close(self):
+        self._file.close()
+
+
+class SessionSnapshot:
+    """A read-only, memory-mapped copy of every session's seconds that
+    answers range totals without querying SQLite.
+
+    The snapshot lives in a directory next to the database. build() writes
+    a base segment from the sessions table and the archive. Once
+    attach()ed, session writes are collected in memory, where queries see
+    them right away. A writer thread appends them to disk as a segment
+    every flush_delay seconds, or as soon as flush_rows have piled up, so
+    the commit path never writes files.
+
+    Segments are merged by size: a new segment is merged into the one
+    before it while that one holds at most merge_ratio times as many rows,
+    or while there are more than max_segments. Small segments thus merge
+    with each other, and the base is only rewritten once the changes after
+    it add up to a fraction of its size.
+
+    A manifest records the segments and the session version they reflect,
+    so a snapshot left on disk is used as is on the next start if the
+    database hasn't changed since, and rebuilt if it has. Every query
+    reads the database's session version, one row, and rebuilds the same
+    way if another process wrote sessions.
+
+    build() reads everything in one read transaction, so session writes
+    never wait for it; the changes they make meanwhile are replayed on
+    top once it is done.
+
+    Totals match SQLitePersistence.get_total_durations: sessions count by
+    their start, and open ones up to now.
+    """
+
+    def __init__(self, directory=None, max_segments=16, merge_ratio=4,
+                 flush_delay=1.0, flush_rows=1000):
+        if directory is None:
+            directory = SQLitePersistence._get_snapshot_directory()
+        self.directory = directory
+        self.max_segments = max_segments
+        self.merge_ratio = merge_ratio
+        self.flush_delay = flush_delay
+        self.flush_rows = flush_rows
+
+        # Guards the segments and changes; held only briefly
+        self._lock = threading.RLock()
+        # Held while files are written, by the writer thread and build()
+        self._write_lock = threading.Lock()
+        # (changes, version) calls collected while build() reads
+        self._replay = None
+        self._changed = threading.Condition(self._lock)
+
+        self._segments = []
+        # Version of the segments on disk, and of them plus the changes
+        # in memory
+        self._saved_version = None
+        self._version = None
+        self._next_name = 0
+        self._attached = False
+        self._writer = None
+        self._stopping = False
+
+        # (project_id, start, seconds) and (project_id, start, sign) rows
+        # not on disk yet; those being written stay in _flushing until
+        # their segment is installed
+        self._pending = ([], [])
+        self._flushing = ([], [])
+
+        self._load_manifest()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_manifest(self):
+        try:
+            with open(self._path("manifest.json")) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        try:
+            self._segments = [SnapshotSegment(self._path(name))
+                              for name in manifest["segments"]]
+        except (OSError, ValueError):
+            self._close_segments()
+            return
+
+        self._saved_version = self._version = manifest["version"]
+        self._next_name = manifest["next_name"]
+
+    def _save_manifest(self):
+        manifest = {
+            "version": self._saved_version,
+            "next_name": self._next_name,
+            "segments": [os.path.basename(segment.path)
+                         for segment in self._segments],
+        }
+
+        path = self._path("manifest.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(manifest, file)
+        os.replace(path + ".tmp", path)
+
+        # Segments no longer listed were merged or rebuilt away
+        listed = set(manifest["segments"]) | {"manifest.json"}
+        for name in os.listdir(self.directory):
+            if name not in listed:
+                os.remove(self._path(name))
+
+    def _write_segment(self, rows, open_rows):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self._next_name:08d}.seg"
+        self._next_name += 1
+        SnapshotSegment.write(self._path(name), rows, open_rows)
+        return SnapshotSegment(self._path(name))
+
+    def _close_segments(self):
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+
+    def _replace_segments(self, segments, version):
+        old = self._segments
+        self._segments = segments
+        self._saved_version = version
+        self._save_manifest()
+        for segment in old:
+            if segment not in segments:
+                segment.close()
+
+    def is_current(self):
+        return (self._version is not None
+                and self._version >= SQLitePersistence.get_session_version())
+
+    def _catch_up(self):
+        """Rebuilds the snapshot if the database has session writes it
+        hasn't seen."""
+        if self.is_current():
+            return
+
+        if self._attached and self._version is not None:
+            # A write of this process may be calling the listeners right
+            # now; once it is done the snapshot has its changes
+            with SQLitePersistence.hold_session_changes():
+                pass
+            if self.is_current():
+                return
+
+        # Written by another process, or while nobody was listening
+        self.build()
+
+    # Locks are always taken in the order session writes take them: first
+    # the persistence lock, then the write lock, then the snapshot's own.
+    # Session writes only ever wait for the snapshot's own lock.
+
+    def build(self):
+        """Rewrites the snapshot from the sessions table and archive,
+        unless it is current once other builds and flushes are done."""
+        with self._write_lock:
+            if self.is_current():
+                return
+
+            with self._lock:
+                if self._attached:
+                    self._replay = []
+
+            try:
+                segments, version = self._read_segments()
+            except BaseException:
+                with self._lock:
+                    self._replay = None
+                    self._version = None
+                raise
+
+            with self._lock:
+                replay = self._replay or []
+                self._replay = None
+
+                # Changes in memory are part of the new base
+                self._pending = ([], [])
+                self._version = version
+                self._replace_segments(segments, version)
+
+                # Writes committed while reading, on top
+                for changes, change_version in replay:
+                    self._apply(changes, change_version)
+
+    def _read_segments(self):
+        con = SQLitePersistence._get_connection()
+        cur = con.cursor()
+
+        # One read transaction, so all of it, archive files included, is
+        # as of `version`
+        cur.execute("BEGIN;")
+        archive = SessionArchive(SQLitePersistence._get_archive_directory())
+        try:
+            version = SQLitePersistence.get_session_version()
+            archive.open([name for name, in cur.execute(
+                "SELECT name FROM archive_files;").fetchall()])
+
+            cur.execute("""
+                SELECT project_id, start, MAX(end - start, 0)
+                FROM sessions WHERE
+                end IS NOT NULL
+                ORDER BY project_id, start
+            """)
+            rows = heapq.merge(
+                cur,
+                *[((project_id, start, max(end - start, 0))
+                   for project_id, start, end in file.iter_rows())
+                  for file in archive.get_files()],
+                key=lambda row: row[:2])
+            segments = [self._write_segment(rows, [])]
+
+            cur.execute("""
+                SELECT project_id, start, 1 FROM sessions WHERE
+                end IS NULL
+            """)
+            open_rows = cur.fetchall()
+        finally:
+            con.rollback()
+            archive.close()
+
+        if open_rows:
+            segments.append(self._write_segment([], open_rows))
+        return (segments, version)
+
+    def attach(self):
+        """Starts following session writes, building the snapshot first if
+        it is missing or out of date."""
+        with SQLitePersistence.hold_session_changes():
+            with self._lock:
+                if not self._attached:
+                    SQLitePersistence.add_session_listener(
+                        self.session_changed)
+                    self._attached = True
+                    self._stopping = False
+                    self._writer = threading.Thread(
+                        target=self._run_writer, daemon=True)
+                    self._writer.start()
+        self._catch_up()
+
+    def detach(self):
+        """Stops following session writes, once the changes collected so
+        far are on disk."""
+        with SQLitePersistence.hold_session_changes():
+            with self._lock:
+                if not self._attached:
+                    return
+                SQLitePersistence.remove_session_listener(
+                    self.session_changed)
+                self._attached = False
+                self._stopping = True
+                self._changed.notify_all()
+                writer = self._writer
+                self._writer = None
+        writer.join()
+
+    def session_changed(self, changes, version):
+        """Session listener: collects the changes for the writer thread."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((changes, version))
+            else:
+                self._apply(changes, version)
+
+    def _apply(self, changes, version):
+        if self._version is not None and version <= self._version:
+            # Already read by build()
+            return
+        if self._version is None or version != self._version + 1:
+            # Writes were missed, the next read rebuilds
+            self._version = None
+            return
+
+        rows, open_rows = self._pending
+        for sign, row in _signed_rows(changes):
+            _, start, end, project_id = row
+            if end is None:
+                open_rows.append((project_id, start, sign))
+            else:
+                rows.append((project_id, start, sign * max(end - start, 0)))
+        self._version = version
+        self._changed.notify_all()
+
+    def _run_writer(self):
+        while True:
+            with self._lock:
+                while not self._stopping and not self._has_pending():
+                    self._changed.wait()
+                if not self._stopping \
+                        and len(self._pending[0]) < self.flush_rows:
+                    # Lets more changes join this segment
+                    self._changed.wait(self.flush_delay)
+                stopping = self._stopping
+
+            self.flush()
+            if stopping:
+                return
+
+    def _has_pending(self):
+        return bool(self._pending[0] or self._pending[1])
+
+    def flush(self):
+        """Writes the changes collected in memory as a new segment."""
+        with self._write_lock:
+            with self._lock:
+                if self._version is None or not self._has_pending():
+                    return
+                self._flushing = self._pending
+                self._pending = ([], [])
+                version = self._version
+                segments = list(self._segments)
+
+            # Queries keep seeing the changes in _flushing meanwhile
+            rows, open_rows = self._flushing
+            new = [self._write_segment(sorted(rows), open_rows)]
+            segments = self._merge_tiers(segments + new, new)
+
+            with self._lock:
+                self._flushing = ([], [])
+                self._replace_segments(segments, version)
+
+    def _merge_tiers(self, segments, new):
+        """Merges the newest segments while they are of similar size."""
+        while len(segments) > 1 and (
+                len(segments) > self.max_segments
+                or _size(segments[-2]) <= self.merge_ratio
+                * _size(segments[-1])):
+            merged = self._merge(segments[-2:])
+            for segment in segments[-2:]:
+                # Installed segments are closed once replaced
+                if segment in new:
+                    segment.close()
+            segments = segments[:-2] + [merged]
+            new.append(merged)
+        return segments
+
+    def _merge(self, segments):
+        """Returns one segment holding the sum of the given ones."""
+        # Removals cancel the additions with the same (project_id, start)
+        rows = heapq.merge(*[segment.iter_rows() for segment in segments],
+                           key=lambda row: row[:2])
+        rows = ((key[0], key[1], sum(row[2] for row in group))
+                for key, group in groupby(rows, key=lambda row: row[:2]))
+
+        open_counts = {}
+        for segment in segments:
+            for project_id, start, sign in segment.iter_open_rows():
+                key = (project_id, start)
+                open_counts[key] = open_counts.get(key, 0) + sign
+
+        return self._write_segment(
+            (row for row in rows if row[2]),
+            [(project_id, start, sign)
+             for (project_id, start), sign in open_counts.items() if sign])
+
+    def get_total_durations(self, project_id, windows):
+        """Returns {name: Duration} for a list of (name, from_, to) windows,
+        like SQLitePersistence.get_total_durations."""
+        now = to_timestamp(datetime.now())
+        self._catch_up()
+
+        with self._lock:
+            changes = [self._flushing, self._pending]
+            totals = {}
+            for name, from_, to in windows:
+                lo, hi = to_timestamp(from_), to_timestamp(to)
+                total = sum(segment.get_total(project_id, lo, hi, now)
+                            for segment in self._segments)
+                for rows, open_rows in changes:
+                    total += _sum_rows(rows, open_rows, project_id, lo, hi,
+                                       now)
+                totals[name] = Duration(total)
+            return totals
+
+    def get_total_duration(self, project_id, from_, to):
+        return self.get_total_durations(
+            project_id, [("total", from_, to)])["total"]
+
+    def close(self):
+        self.detach()
+        with self._lock:
+            self._close_segments()
+            self._version = self._saved_version = None
+
+
+def _size(segment):
+    return segment.count + segment.open_count
+
+
+def _sum_rows(rows, open_rows, project_id, lo, hi, now):
+    """Sums changes not written to a segment yet, like
+    SnapshotSegment.get_total."""
+    total = 0
+    for row_project_id, start, seconds in rows:
+        if row_project_id == project_id and lo <= start <= hi:
+            total += seconds
+    for row_project_id, start, sign in open_rows:
+        if row_project_id == project_id and lo <= start <= hi:
+            total += sign * max(now - start, 0)
+    return total
+
+
+def _signed_rows(changes):
+    for old, new in changes:
+        if old is not None:
+            yield (-1, old)
+        if new is not None:
+            yield (1, new)
@@ -0,0 +1,261 @@
+from datetime import date, datetime, timedelta
+import os
+import pytest
+from dtimetracker.archive import ArchiveFile, SessionArchive
+from dtimetracker.core import to_timestamp
+from dtimetracker.export import SessionExporter
+from dtimetracker.importer import SessionImporter
+from dtimetracker.persistence import SQLitePersistence
+from dtimetracker.reports import ReportEngine
+from tests.test_sql_persistence import (
+    init_sqlite, init_projects, init_sessions)
+
+
+def snapshot(project_id, from_, to):
+    sessions = SQLitePersistence.get_sessions(project_id, from_, to)
+    return ([(s.id, s.start, s.end) for s in sessions],
+            SQLitePersistence.get_total_duration(project_id, from_, to))
+
+
+def test_archived_sessions_are_still_read():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    # An open session's total would grow between the snapshots
+    session = SQLitePersistence.get_open_session(5)
+    session.stop()
+    SQLitePersistence.update_session(session)
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    from_ = today - timedelta(days=30)
+    to = today + timedelta(days=1)
+    before = {pid: snapshot(pid, from_, to) for pid in range(1, 6)}
+    report = ReportEngine.get_daily_totals(from_, to)
+
+    moved = SQLitePersistence.archive_sessions(today - timedelta(days=1))
+    assert moved == 6
+
+    con = SQLitePersistence._get_connection()
+    assert con.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 6
+
+    for pid in range(1, 6):
+        assert snapshot(pid, from_, to) == before[pid]
+    assert ReportEngine.get_daily_totals(from_, to) == report
+
+    # ranges reaching partly into the archive
+    assert snapshot(4, today - timedelta(days=2), to)[1] == (
+        8 * 3600 + 20 * 60 + 10
+        + 4 * 3600 + 10 * 60 + 10 + 3 * 3600 + 30 * 60
+        + 4 * 3600 + 10 * 60 + 10)
+
+    # the archive is found again after reopening the database
+    SQLitePersistence.init_db()
+    for pid in range(1, 6):
+        assert snapshot(pid, from_, to) == before[pid]
+
+    # and is part of rebuilt rollups
+    SQLitePersistence.rebuild_rollups()
+    assert ReportEngine.get_daily_totals(from_, to) == report
+
+
+def test_archiving_only_moves_closed_sessions():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    tomorrow = datetime.now() + timedelta(days=1)
+    assert SQLitePersistence.archive_sessions(tomorrow) == 11
+    assert SQLitePersistence.get_open_session(5) is not None
+
+    # nothing left to move, so no file is written
+    assert SQLitePersistence.archive_sessions(tomorrow) == 0
+    assert len(SQLitePersistence._get_archive().get_files()) == 1
+
+    SQLitePersistence.delete_db()
+    assert not os.path.exists(SQLitePersistence._get_archive_directory())
+
+
+def test_reads_skip_files_outside_the_range(tmp_path, monkeypatch):
+    archive = SessionArchive(str(tmp_path))
+
+    day = to_timestamp(date(2022, 3, 1))
+    for n in range(3):
+        start = day + n * 86400
+        rows = [(10 * n + i, start + i * 3600, start + i * 3600 + 600, pid)
+                for pid in (1, 2) for i in range(3)]
+        archive.write(f"{n}.dta", rows)
+        archive.add(f"{n}.dta")
+
+    read = []
+    get_rows = ArchiveFile.get_rows
+    monkeypatch.setattr(
+        ArchiveFile, "get_rows",
+        lambda self, *args: read.append(self.path) or get_rows(self, *args))
+
+    rows = archive.get_rows(2, day + 86400, day + 86400 + 7200)
+    assert [row[0] for row in rows] == [10, 11, 12]
+    assert read == [str(tmp_path / "1.dta")]
+
+    assert archive.get_total(1, day, day + 3 * 86400) == 9 * 600
+    assert archive.get_total(3, day, day + 3 * 86400) == 0
+
+    archive.close()
+
+
+def test_archived_ids_are_never_reused():
+    init_sqlite()
+    init_projects()
+
+    day = datetime(2022, 3, 1, 8)
+    SQLitePersistence.create_sessions(
+        [(1, day + timedelta(days=i), day + timedelta(days=i, hours=1))
+         for i in range(3)])
+    assert SQLitePersistence.archive_sessions(day + timedelta(days=10)) == 3
+
+    session = SQLitePersistence.create_session(
+        1, day + timedelta(days=20), day + timedelta(days=20, hours=1))
+    assert session.id == 4
+    assert SQLitePersistence.create_sessions(
+        [(1, day + timedelta(days=21), None)]) == range(5, 6)
+
+    ids = [s.id for s in SQLitePersistence.get_sessions(
+        1, day, day + timedelta(days=30))]
+    assert ids == [1, 2, 3, 4, 5]
+
+
+def test_migration_starts_ids_above_the_archive():
+    init_sqlite()
+    init_projects()
+
+    day = datetime(2022, 3, 1, 8)
+    SQLitePersistence.create_sessions(
+        [(1, day + timedelta(days=i), day + timedelta(days=i, hours=1))
+         for i in range(3)])
+    SQLitePersistence.archive_sessions(day + timedelta(days=10))
+
+    # Back to the schema before ids were kept from being reused
+    con = SQLitePersistence._get_connection()
+    con.execute("BEGIN;")
+    con.execute("""
+        CREATE TABLE sessions_old (
+            id INTEGER PRIMARY KEY,
+            start INTEGER NOT NULL,
+            end INTEGER,
+            project_id INTEGER NOT NULL
+        );
+    """)
+    con.execute("DROP TABLE sessions;")
+    con.execute("ALTER TABLE sessions_old RENAME TO sessions;")
+    con.execute("DELETE FROM sqlite_sequence;")
+    version = SQLitePersistence._migrations.index("_never_reuse_session_ids")
+    con.execute(f"PRAGMA user_version = {version};")
+    con.commit()
+
+    SQLitePersistence.init_db()
+    session = SQLitePersistence.create_session(
+        1, day + timedelta(days=20), day + timedelta(days=20, hours=1))
+    assert session.id == 4
+
+
+def test_archive_files_are_never_overwritten():
+    init_sqlite()
+    init_projects()
+
+    day = datetime(2022, 3, 1, 8)
+    for week in range(3):
+        SQLitePersistence.create_sessions(
+            [(1, day + timedelta(days=7 * week + i),
+              day + timedelta(days=7 * week + i, hours=1))
+             for i in range(2)])
+        SQLitePersistence.archive_sessions(day + timedelta(days=7 * week + 5))
+
+    names = [os.path.basename(file.path)
+             for file in SQLitePersistence._get_archive().get_files()]
+    assert len(set(names)) == 3
+    assert len(SQLitePersistence.get_sessions(
+        1, day, day + timedelta(days=30))) == 6
+
+    # A listed file is neither replaced nor discarded
+    archive = SQLitePersistence._get_archive()
+    with pytest.raises(FileExistsError):
+        archive.write(names[0], [])
+    archive.discard(names[0])
+    assert archive.exists(names[0])
+
+    # A file left by an archiving that never committed is skipped
+    archive.write("sessions-00000004.dta", [])
+    SQLitePersistence.create_session(
+        1, day + timedelta(days=25), day + timedelta(days=25, hours=1))
+    SQLitePersistence.archive_sessions(day + timedelta(days=26))
+    assert "sessions-00000005.dta" in [
+        os.path.basename(file.path) for file in archive.get_files()]
+    assert len(SQLitePersistence.get_sessions(
+        1, day, day + timedelta(days=30))) == 7
+
+
+def test_archived_sessions_cannot_be_changed():
+    init_sqlite()
+    init_projects()
+
+    day = datetime(2022, 3, 1, 8)
+    SQLitePersistence.create_sessions(
+        [(1, day + timedelta(days=i), day + timedelta(days=i, hours=1))
+         for i in range(3)])
+    SQLitePersistence.archive_sessions(day + timedelta(days=2))
+
+    assert SQLitePersistence.get_archived_session_ids(
+        1, day, day + timedelta(days=10)) == {1, 2}
+
+    archived = SQLitePersistence.get_sessions(
+        1, day, day + timedelta(hours=1))[0]
+    archived.end += timedelta(hours=1)
+    with pytest.raises(ValueError):
+        SQLitePersistence.update_session(archived)
+    with pytest.raises(ValueError):
+        SQLitePersistence.delete_session(archived)
+    assert len(SQLitePersistence.get_sessions(
+        1, day, day + timedelta(days=10))) == 3
+
+    # Sessions that are simply gone are still ignored
+    live = SQLitePersistence.get_session(3)
+    SQLitePersistence.delete_session(live)
+    SQLitePersistence.delete_session(live)
+    SQLitePersistence.update_session(live)
+
+
+def test_archived_sessions_are_paged_exported_and_deduplicated(tmp_path):
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    from_ = datetime.now() - timedelta(days=30)
+    to = datetime.now() + timedelta(days=1)
+    before = [(s.id, s.start, s.end) for s in
+              SQLitePersistence.get_sessions(1, from_, to)]
+    count = SQLitePersistence.count_sessions()
+    # The open session's seconds keep growing
+    records = list(SQLitePersistence.iter_session_records(status="closed"))
+    path = str(tmp_path / "history.csv")
+    SessionExporter.export_to_path(path)
+
+    SQLitePersistence.archive_sessions(datetime.now() - timedelta(days=1))
+
+    page = SQLitePersistence.get_sessions_page(1, from_, to, limit=2)
+    page += SQLitePersistence.get_sessions_page(
+        1, from_, to, after=page[-1], limit=2)
+    assert [(s.id, s.start, s.end) for s in page] == before
+    assert [(s.id, s.start, s.end) for s in
+            SQLitePersistence.iter_sessions(1, from_, to, batch_size=1)] \
+        == before
+
+    assert SQLitePersistence.count_sessions() == count
+    assert SQLitePersistence.count_sessions(status="closed") == count - 1
+    assert SQLitePersistence.count_sessions(project_ids=[1]) == len(before)
+    assert list(SQLitePersistence.iter_session_records(
+        status="closed")) == records
+
+    # Re-importing the export finds the archived sessions already there
+    report = SessionImporter.import_file(path)
+    assert report.imported == 0
+    assert report.duplicates == count - 1
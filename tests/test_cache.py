@@ -0,0 +1,246 @@
+from datetime import datetime, timedelta
+import sqlite3
+import time
+from dtimetracker.cache import RangeCache
+from dtimetracker.core import to_timestamp
+from dtimetracker.persistence import SQLitePersistence
+from tests.test_sql_persistence import (
+    init_sqlite, init_projects, init_sessions)
+
+
+def _count_queries(call, *args):
+    con = SQLitePersistence._get_connection()
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        result = call(*args)
+    finally:
+        con.set_trace_callback(None)
+    return result, len(statements)
+
+
+def test_project_lookups_are_served_from_the_catalogue():
+    init_sqlite()
+    init_projects()
+    SQLitePersistence.get_projects()
+
+    # Only the version of the projects table is read
+    names, queries = _count_queries(SQLitePersistence.get_project_names)
+    assert names == ["A Project", "B Project", "C Project", "D Project",
+                     "E Project"]
+    assert queries == 1
+
+    project, queries = _count_queries(
+        SQLitePersistence.get_project_by_name, "C Project")
+    assert project.id == 3
+    assert queries == 1
+
+    assert _count_queries(SQLitePersistence.get_project, 4)[1] == 1
+
+
+def test_project_writes_patch_the_catalogue():
+    init_sqlite()
+    init_projects()
+    version = SQLitePersistence.get_projects_version()
+
+    SQLitePersistence.update_project(
+        SQLitePersistence.get_project(2), "Renamed Project")
+    SQLitePersistence.delete_project(SQLitePersistence.get_project(3))
+    f = SQLitePersistence.create_project("F Project")
+
+    assert SQLitePersistence.get_projects_version() == version + 3
+    assert SQLitePersistence.get_project_by_name("B Project") is None
+    assert SQLitePersistence.get_project_by_name("Renamed Project").id == 2
+    assert SQLitePersistence.get_project(3) is None
+    assert SQLitePersistence.get_project(f.id).name == "F Project"
+    assert SQLitePersistence.get_project_names() == [
+        "A Project", "Renamed Project", "D Project", "E Project", "F Project"]
+
+    # matches what a fresh load from the database sees
+    names = SQLitePersistence.get_project_names()
+    SQLitePersistence._projects.invalidate()
+    assert SQLitePersistence.get_project_names() == names
+
+
+def _connect_elsewhere():
+    # A connection of its own, like another process's
+    return sqlite3.connect(SQLitePersistence._db_name)
+
+
+def test_catalogue_sees_projects_written_elsewhere():
+    init_sqlite()
+    init_projects()
+    version = SQLitePersistence.get_projects_version()
+    assert SQLitePersistence.get_project_by_name("F Project") is None
+
+    con = _connect_elsewhere()
+    con.execute("INSERT INTO projects (name) VALUES ('F Project');")
+    con.execute("UPDATE projects_version SET version = version + 1;")
+    con.commit()
+    con.close()
+
+    assert SQLitePersistence.get_project_by_name("F Project").id == 6
+    assert SQLitePersistence.get_projects_version() > version
+
+
+def test_catalogue_hands_out_copies():
+    init_sqlite()
+    init_projects()
+
+    SQLitePersistence.get_project(1).name = "Changed outside"
+
+    assert SQLitePersistence.get_project(1).name == "A Project"
+
+
+def test_repeated_range_queries_hit_the_cache():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    start = datetime.now() - timedelta(days=30)
+    end = datetime.now().replace(hour=23, minute=59, second=59)
+
+    # Hits only read the session version
+    first = SQLitePersistence.get_sessions(1, start, end)
+    second, queries = _count_queries(
+        SQLitePersistence.get_sessions, 1, start, end)
+
+    assert queries == 1
+    assert [str(s) for s in first] == [str(s) for s in second]
+    assert first[0] is not second[0]
+
+    SQLitePersistence.get_total_duration(1, start, end)
+    total, queries = _count_queries(
+        SQLitePersistence.get_total_duration, 1, start, end)
+    assert queries == 1
+    assert total == 21 * 3600 + 21 * 60
+
+    stats = SQLitePersistence.get_cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["entries"] == 2
+
+
+def test_writes_only_invalidate_overlapping_ranges():
+    init_sqlite()
+    init_projects()
+
+    day = datetime(2022, 3, 1)
+    week_1 = (day, day + timedelta(days=7))
+    week_2 = (day + timedelta(days=7), day + timedelta(days=14))
+
+    SQLitePersistence.get_sessions(1, *week_1)
+    SQLitePersistence.get_sessions(1, *week_2)
+    SQLitePersistence.get_sessions(2, *week_1)
+
+    s = SQLitePersistence.create_session(
+        1, day + timedelta(days=1), day + timedelta(days=1, hours=2))
+    assert SQLitePersistence.get_cache_stats()["entries"] == 2
+    assert len(SQLitePersistence.get_sessions(1, *week_1)) == 1
+
+    # Moving the session invalidates both its old and new week
+    SQLitePersistence.get_sessions(1, *week_2)
+    s.start += timedelta(days=8)
+    s.end += timedelta(days=8)
+    SQLitePersistence.update_session(s)
+    assert len(SQLitePersistence.get_sessions(1, *week_1)) == 0
+    assert len(SQLitePersistence.get_sessions(1, *week_2)) == 1
+
+    SQLitePersistence.delete_session(s)
+    assert len(SQLitePersistence.get_sessions(1, *week_2)) == 0
+
+    assert SQLitePersistence.get_cache_stats()["invalidations"] == 4
+
+
+def test_range_cache_sees_sessions_written_elsewhere():
+    init_sqlite()
+    init_projects()
+
+    day = (datetime(2022, 3, 1), datetime(2022, 3, 1, 23, 59, 59))
+    assert SQLitePersistence.get_sessions(1, *day) == []
+    assert SQLitePersistence.get_total_duration(1, *day) == 0
+
+    con = _connect_elsewhere()
+    con.execute(
+        "INSERT INTO sessions (start, end, project_id) VALUES (?, ?, 1);",
+        (to_timestamp(datetime(2022, 3, 1, 9)),
+         to_timestamp(datetime(2022, 3, 1, 10))))
+    con.execute("UPDATE session_version SET version = version + 1;")
+    con.commit()
+    con.close()
+
+    assert len(SQLitePersistence.get_sessions(1, *day)) == 1
+    assert SQLitePersistence.get_total_duration(1, *day) == 3600
+
+    # This process's own writes keep the rest of the cache
+    SQLitePersistence.get_sessions(2, *day)
+    SQLitePersistence.create_session(
+        1, datetime(2022, 3, 1, 11), datetime(2022, 3, 1, 12))
+    assert SQLitePersistence.get_cache_stats()["entries"] == 1
+    assert len(SQLitePersistence.get_sessions(1, *day)) == 2
+
+
+def test_sessions_ending_before_they_start_invalidate_their_start():
+    init_sqlite()
+    init_projects()
+
+    day = (datetime(2022, 3, 1), datetime(2022, 3, 1, 23, 59, 59))
+    assert SQLitePersistence.get_sessions(1, *day) == []
+    assert SQLitePersistence.get_total_duration(1, *day) == 0
+
+    # As the edit dialog allows
+    SQLitePersistence.create_session(
+        1, datetime(2022, 3, 1, 9), datetime(2022, 2, 28, 17))
+    assert len(SQLitePersistence.get_sessions(1, *day)) == 1
+
+    s = SQLitePersistence.create_session(
+        2, datetime(2022, 3, 1, 9), datetime(2022, 3, 1, 10))
+    assert SQLitePersistence.get_total_duration(2, *day) == 3600
+    s.end = datetime(2022, 2, 28, 17)
+    SQLitePersistence.update_session(s)
+    assert SQLitePersistence.get_total_duration(2, *day) == 0
+
+
+def test_range_cache_is_bounded_by_rows():
+    cache = RangeCache(max_entries=10, max_rows=100)
+
+    cache.put("a", 1, 0, 10, ["row"] * 60, cache.generation, rows=60)
+    cache.put("b", 1, 10, 20, ["row"] * 30, cache.generation, rows=30)
+    assert cache.stats()["rows"] == 90
+
+    # Evicts the least recently used entries until the rows fit
+    cache.get("a")
+    cache.put("c", 2, 0, 10, ["row"] * 30, cache.generation, rows=30)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["rows"] == 90
+
+    # Too large to cache at all
+    cache.put("d", 2, 0, 10, ["row"] * 101, cache.generation, rows=101)
+    assert cache.get("d") is None
+    assert cache.stats()["entries"] == 2
+
+    cache.invalidate_project(1)
+    assert cache.stats()["rows"] == 30
+
+
+def test_cached_totals_keep_counting_open_sessions():
+    init_sqlite()
+    init_projects()
+
+    started = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    SQLitePersistence.create_session(1, started)
+    windows = [("today", started - timedelta(hours=1),
+                started + timedelta(days=1))]
+
+    first = SQLitePersistence.get_total_durations(1, windows)["today"]
+    time.sleep(1.1)
+
+    before = int((datetime.now() - started).total_seconds())
+    second, queries = _count_queries(
+        SQLitePersistence.get_total_durations, 1, windows)
+    after = int((datetime.now() - started).total_seconds())
+
+    assert queries == 1
+    assert second["today"] >= first + 1
+    assert before <= second["today"] <= after
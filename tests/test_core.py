@@ -1,4 +1,6 @@
-from dtimetracker.core import Project, Session
+from dtimetracker import core
+from dtimetracker.core import (
+    Duration, Project, Session, SessionBatch, sum_durations, to_timestamp)
 from datetime import datetime, timedelta
 import pytest
 
@@ -50,3 +52,97 @@ def test_can_compute_open_session(test_project):
 
     computed = s.compute_duration()
     assert computed == (expected_hours, expected_minutes)
+
+
+def test_session_from_sql_result_reads_epoch_seconds():
+    start = datetime(2022, 3, 1, 8, 0, 0)
+    end = datetime(2022, 3, 1, 12, 30, 15)
+
+    s = Session.from_sql_result(
+        (7, to_timestamp(start), to_timestamp(end), 2))
+    assert (s.id, s.project_id, s.start, s.end) == (7, 2, start, end)
+
+    s = Session.from_sql_result((8, to_timestamp(start), None, 2))
+    assert s.end is None
+
+
+def test_session_has_no_instance_dict():
+    s = Session(Project("Test Project", id=1))
+    assert not hasattr(s, "__dict__")
+
+
+def test_session_batch_computes_durations():
+    batch = SessionBatch.from_sql_results([
+        (1, 1000, 1600, 1),
+        (2, 2000, 2030, 2),
+        (3, 5000, None, 1),
+    ])
+
+    assert len(batch) == 3
+    assert list(batch.durations(now=5100)) == [600, 30, 100]
+    assert batch.total_duration(now=5100) == 730
+
+    # Open sessions that start after "now" don't count negative time
+    assert batch.total_duration(now=4000) == 630
+
+    s = batch[2]
+    assert (s.id, s.project_id, s.end) == (3, 1, None)
+
+
+def test_sum_durations_is_exact_with_and_without_numpy(monkeypatch):
+    starts = [0, 100, 200, 10 ** 12]
+    ends = [59, 90, SessionBatch.OPEN, 10 ** 12 + 7]
+    expected = 59 + 0 + 250 + 7
+
+    assert sum_durations(starts, ends, now=450) == expected
+
+    monkeypatch.setattr(core, "np", None)
+    assert sum_durations(starts, ends, now=450) == expected
+    assert sum_durations([], [], now=450) == 0
+
+
+def test_duration_sums_exactly_and_formats_consistently():
+    d = Duration(3 * 3600 + 5 * 60 + 59)
+    assert d.split() == (3, 5, 59)
+    assert str(d) == "03:05"
+    assert str(Duration(0)) == "00:00"
+    assert str(Duration(125 * 3600)) == "125:00"
+
+    total = d + Duration(1)
+    assert isinstance(total, Duration)
+    assert total.split() == (3, 6, 0)
+    assert isinstance(7 + d, Duration)
+
+    start = datetime(2022, 3, 1, 8, 0, 0)
+    assert Duration.between(start, start + timedelta(seconds=90)) == 90
+    assert Duration.between(start, start - timedelta(hours=1)) == 0
+
+
+def test_session_duration_matches_pretty_duration(test_project):
+    s = Session(test_project)
+    s.start = datetime(2022, 3, 1, 8, 0, 0)
+    s.end = datetime(2022, 3, 1, 9, 7, 30)
+
+    assert s.duration() == 67 * 60 + 30
+    assert s.compute_duration() == (1, 7)
+    assert s.get_pretty_duration() == "01:07"
+
+
+def test_totals_over_a_million_sessions_are_exact():
+    batch = SessionBatch()
+    start = 1_600_000_000
+    expected = 0
+    for i in range(1_000_000):
+        length = 1 + i % 7919
+        batch.append(i, start, start + length, 1)
+        expected += length
+        start += length + 17
+
+    total = batch.total_duration(now=start)
+    assert isinstance(total, Duration)
+    assert total == expected
+    assert Duration.sum(Duration(d) for d in batch.durations(now=start)) \
+        == expected
+
+    hours, minutes, seconds = total.split()
+    assert hours * 3600 + minutes * 60 + seconds == expected
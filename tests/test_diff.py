@@ -0,0 +1,14 @@
+from dtimetracker.gui.diff import keyed_diff
+
+
+def test_keyed_diff_finds_added_removed_and_changed_rows():
+    old = {1: ("A Project", False), 2: ("B Project", True), 3: ("C", False)}
+    new = {1: ("A Project", False), 2: ("B Project", False), 4: ("D", False)}
+
+    assert keyed_diff(old, new) == ([4], [3], [2])
+
+
+def test_keyed_diff_of_identical_rows_is_empty():
+    rows = {i: (i, i * 2) for i in range(1000)}
+
+    assert keyed_diff(rows, dict(rows)) == ([], [], [])
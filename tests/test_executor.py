@@ -0,0 +1,119 @@
+import threading
+import time
+from dtimetracker.gui.executor import BackgroundExecutor
+
+
+class FakeRoot:
+    """Stands in for tk.Tk: after() callbacks run when run_pending() is
+    called, on the test's own thread."""
+
+    def __init__(self):
+        self.scheduled = {}
+        self.reported = []
+        self._next_id = 0
+
+    def after(self, ms, callback):
+        self._next_id += 1
+        self.scheduled[self._next_id] = callback
+        return self._next_id
+
+    def after_cancel(self, after_id):
+        self.scheduled.pop(after_id, None)
+
+    def report_callback_exception(self, exc_type, exception, traceback):
+        self.reported.append(exception)
+
+    def run_pending(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self.scheduled and time.monotonic() < deadline:
+            after_id = min(self.scheduled)
+            self.scheduled.pop(after_id)()
+            time.sleep(0.001)
+
+
+def test_callbacks_run_on_the_tk_thread():
+    root = FakeRoot()
+    executor = BackgroundExecutor(root)
+    results = []
+
+    executor.submit(
+        lambda a, b: (a + b, threading.current_thread()), 1, 2,
+        callback=results.append)
+    root.run_pending()
+
+    assert len(results) == 1
+    assert results[0][0] == 3
+    assert results[0][1] is not threading.current_thread()
+    assert not root.scheduled
+
+    executor.shutdown()
+
+
+def test_newer_calls_replace_stale_calls_with_the_same_key():
+    root = FakeRoot()
+    executor = BackgroundExecutor(root, max_workers=1)
+    release = threading.Event()
+    results = []
+
+    def query(value):
+        release.wait()
+        return value
+
+    for value in ("Today", "This week", "Last month"):
+        executor.submit(query, value, callback=results.append, key="scope")
+    executor.submit(query, "other", callback=results.append, key="other")
+    release.set()
+    root.run_pending()
+
+    assert results == ["Last month", "other"]
+
+    executor.shutdown()
+
+
+def test_errors_go_to_the_errback_or_tk():
+    root = FakeRoot()
+    executor = BackgroundExecutor(root)
+    errors = []
+
+    def fail():
+        raise ValueError("no such project")
+
+    executor.submit(fail, errback=errors.append)
+    executor.submit(fail)
+    root.run_pending()
+
+    assert [str(e) for e in errors] == ["no such project"]
+    assert [str(e) for e in root.reported] == ["no such project"]
+
+    executor.shutdown()
+
+
+def test_writes_run_in_order_and_are_never_dropped():
+    root = FakeRoot()
+    executor = BackgroundExecutor(root)
+    release = threading.Event()
+    written = []
+    threads = set()
+
+    def write(value):
+        release.wait()
+        threads.add(threading.current_thread())
+        written.append(value)
+        return value
+
+    results = []
+    for value in range(20):
+        executor.submit_write(write, value, callback=results.append)
+    release.set()
+    root.run_pending()
+
+    assert written == list(range(20))
+    assert results == list(range(20))
+    assert len(threads) == 1
+
+    # Shutting down waits for the queued writes
+    release.clear()
+    executor.submit_write(write, 20)
+    threading.Timer(0.05, release.set).start()
+    executor.shutdown()
+    assert written[-1] == 20
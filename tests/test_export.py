@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+import csv
+import io
+import pytest
+from dtimetracker.export import SessionExporter
+from dtimetracker.persistence import SQLitePersistence
+from tests.test_sql_persistence import (
+    init_sqlite, init_projects, init_sessions)
+
+
+def export_rows(format="csv", **filters):
+    file = io.StringIO()
+    count = SessionExporter.export(file, format=format, **filters)
+
+    dialect = SessionExporter.formats[format]
+    rows = list(csv.reader(io.StringIO(file.getvalue()), dialect=dialect))
+    assert rows[0] == list(SessionExporter.header)
+    assert len(rows) == count + 1
+    return rows[1:]
+
+
+def test_exports_every_session():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    rows = export_rows()
+    assert len(rows) == 12
+
+    session = SQLitePersistence.get_session(int(rows[0][0]))
+    project = SQLitePersistence.get_project(session.project_id)
+    assert rows[0] == [
+        str(session.id),
+        project.name,
+        session.start.strftime("%Y-%m-%d %H:%M:%S"),
+        session.end.strftime("%Y-%m-%d %H:%M:%S"),
+        str(int((session.end - session.start).total_seconds())),
+    ]
+
+    # grouped by project, ordered by start
+    keys = [(row[1], row[2]) for row in rows]
+    assert keys == sorted(keys)
+
+
+def test_export_filters():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    rows = export_rows(project_ids=[2, 5])
+    assert {row[1] for row in rows} == {"B Project", "E Project"}
+    assert len(rows) == 3
+
+    rows = export_rows(status="open")
+    assert len(rows) == 1
+    assert rows[0][1] == "E Project"
+    assert rows[0][3] == ""
+
+    assert len(export_rows(status="closed")) == 11
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = export_rows(project_ids=[4], from_=today - timedelta(days=2),
+                       to=today - timedelta(seconds=1))
+    assert len(rows) == 3
+
+    assert export_rows(project_ids=[]) == []
+
+    with pytest.raises(ValueError):
+        export_rows(status="paused")
+
+
+def test_exports_tsv_with_progress():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    file = io.StringIO()
+    calls = []
+    count = SessionExporter.export(
+        file, format="tsv", progress=lambda done, total: calls.append(
+            (done, total)),
+        progress_every=5)
+
+    assert count == 12
+    assert calls == [(5, 12), (10, 12), (12, 12)]
+    assert "\tA Project\t" in file.getvalue()
+
+    with pytest.raises(ValueError):
+        SessionExporter.export(io.StringIO(), format="xlsx")
@@ -0,0 +1,105 @@
+from datetime import datetime
+import json
+import pytest
+from dtimetracker.core import to_timestamp
+from dtimetracker.export import SessionExporter
+from dtimetracker.importer import SessionImporter
+from dtimetracker.persistence import SQLitePersistence
+from tests.test_sql_persistence import (
+    init_sqlite, init_projects, init_sessions)
+
+
+def test_can_import_csv(tmp_path):
+    init_sqlite()
+    init_projects()
+
+    path = tmp_path / "history.csv"
+    path.write_text(
+        "project,start,end\n"
+        "A Project,2022-03-01 08:00:00,2022-03-01 12:30:00\n"
+        "New Project,2022-03-02T09:00:00,2022-03-02T10:00:15\n"
+        "A Project,2022-03-01 08:00:00,2022-03-01 09:00:00\n"
+        "A Project,2022-03-03 08:00:00,2022-03-03 07:00:00\n"
+        "A Project,yesterday,2022-03-03 07:00:00\n"
+        ",2022-03-04 08:00:00,2022-03-04 09:00:00\n"
+        "B Project,2022-03-05 08:00:00,\n")
+
+    report = SessionImporter.import_file(str(path))
+
+    assert (report.read, report.imported, report.duplicates,
+            report.rejected) == (7, 2, 1, 4)
+    assert report.rejected_rows == [
+        (5, "negative duration"),
+        (6, "invalid start: 'yesterday'"),
+        (7, "missing project"),
+        (8, "missing end"),
+    ]
+    assert report.created_projects == ["New Project"]
+    assert report.rows_per_second > 0
+
+    project = SQLitePersistence.get_project_by_name("New Project")
+    sessions = SQLitePersistence.get_sessions(
+        project.id, datetime(2022, 3, 1), datetime(2022, 3, 31))
+    assert [(s.start, s.end) for s in sessions] == [
+        (datetime(2022, 3, 2, 9), datetime(2022, 3, 2, 10, 0, 15))]
+
+
+def test_can_import_json_lines_in_batches(tmp_path):
+    init_sqlite()
+    init_projects()
+
+    start = to_timestamp(datetime(2022, 3, 1, 8, 0))
+    lines = [json.dumps({"project": "B Project", "start": start + i * 3600,
+                         "end": start + i * 3600 + 1800})
+             for i in range(25)]
+    # repeated after the batch that stored it
+    lines.append(lines[0])
+    lines.append("{not json")
+    lines.append("[1, 2]")
+    lines.append("")
+
+    path = tmp_path / "history.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+
+    report = SessionImporter.import_file(
+        str(path), batch_size=10, create_projects=False)
+
+    assert (report.read, report.imported, report.duplicates,
+            report.rejected) == (28, 25, 1, 2)
+    assert report.rejected_rows[1] == (28, "not a JSON object")
+
+    total = SQLitePersistence.get_total_duration(
+        2, datetime(2022, 3, 1), datetime(2022, 3, 3))
+    assert total == 25 * 1800
+
+    # Rollups are kept up to date by the bulk insert
+    rows = SQLitePersistence.get_period_totals(
+        "day", datetime(2022, 3, 1).date(), datetime(2022, 3, 2).date(), 2)
+    assert sum(seconds for _, _, seconds in rows) == 25 * 1800
+
+
+def test_unknown_projects_can_be_rejected():
+    init_sqlite()
+    init_projects()
+
+    records = [(2, {"project": "Z Project", "start": "2022-03-01 08:00",
+                    "end": "2022-03-01 09:00"})]
+    report = SessionImporter.import_records(records, create_projects=False)
+
+    assert report.rejected_rows == [(2, "unknown project: Z Project")]
+    assert SQLitePersistence.get_project_by_name("Z Project") is None
+
+
+def test_exported_history_imports_back_as_duplicates(tmp_path):
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    path = tmp_path / "export.tsv"
+    SessionExporter.export_to_path(str(path), status="closed", format="tsv")
+
+    report = SessionImporter.import_file(str(path))
+    assert (report.read, report.imported, report.duplicates) == (11, 0, 11)
+
+    with pytest.raises(ValueError):
+        SessionImporter.import_file(str(tmp_path / "export.xlsx"))
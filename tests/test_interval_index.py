@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+import random
+import sqlite3
+import threading
+from dtimetracker.core import Duration, to_timestamp
+from dtimetracker.interval_index import IntervalIndex, ProjectIntervals
+from dtimetracker.persistence import SQLitePersistence
+from tests.test_sql_persistence import (
+    init_sqlite, init_projects, init_sessions)
+
+
+def overlap_total(rows, lo, hi, now):
+    total = 0
+    for _, start, end in rows:
+        end = now if end is None else max(end, start)
+        total += max(min(end, hi) - max(start, lo), 0)
+    return total
+
+
+def test_project_intervals_match_overlap_sums():
+    rng = random.Random(25)
+    rows = []
+    for id in range(1, 300):
+        start = rng.randrange(0, 100000)
+        rows.append((id, start, start + rng.randrange(-10, 5000)))
+    rows.append((300, 99000, None))
+    # Forgotten to stop, it overlaps every other session
+    rows.append((301, -5000, 500000))
+    now = 101000
+
+    intervals = ProjectIntervals(rows)
+    for _ in range(200):
+        lo = rng.randrange(-1000, 102000)
+        hi = lo + rng.randrange(0, 20000)
+        assert intervals.total(lo, hi, now) == overlap_total(
+            rows, lo, hi, now)
+
+    # Remove and add sessions in the middle and at the end
+    for row in rows[:100] + [rows[-1]]:
+        intervals.remove(*row)
+    rows = rows[100:-1]
+    for id in range(301, 350):
+        start = rng.randrange(0, 120000)
+        row = (id, start, start + rng.randrange(0, 5000))
+        intervals.add(*row)
+        rows.append(row)
+
+        lo = rng.randrange(-1000, 122000)
+        hi = lo + rng.randrange(0, 20000)
+        assert intervals.total(lo, hi, now) == overlap_total(
+            rows, lo, hi, now)
+
+
+def get_windows():
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("today", today, today + timedelta(days=1)),
+        ("noon", today + timedelta(hours=11, minutes=30),
+         today + timedelta(hours=12, minutes=15)),
+        ("two weeks", today - timedelta(days=14), today + timedelta(days=1)),
+        ("all", datetime(2000, 1, 1), today + timedelta(days=2)),
+        ("none", datetime(2000, 1, 1), datetime(2000, 1, 2)),
+    ]
+
+
+def assert_matches_sessions(index):
+    windows = get_windows()
+    for project_id in range(1, 6):
+        rows = [(session.id, to_timestamp(session.start),
+                 None if session.end is None else to_timestamp(session.end))
+                for session in SQLitePersistence.get_sessions(
+                    project_id, datetime(2000, 1, 1),
+                    datetime.now() + timedelta(days=2))]
+
+        # Open sessions may grow by a second between the calls
+        before = to_timestamp(datetime.now())
+        totals = index.get_total_durations(project_id, windows)
+        after = to_timestamp(datetime.now())
+        for name, from_, to in windows:
+            lo, hi = to_timestamp(from_), to_timestamp(to)
+            assert (overlap_total(rows, lo, hi, before)
+                    <= totals[name]
+                    <= overlap_total(rows, lo, hi, after))
+            assert isinstance(totals[name], Duration)
+
+
+def test_interval_index_matches_sessions():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+    SQLitePersistence.archive_sessions(datetime.now() - timedelta(days=2))
+
+    index = IntervalIndex()
+    assert_matches_sessions(index)
+
+
+def test_interval_index_follows_writes():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    index = IntervalIndex()
+    index.attach()
+    assert_matches_sessions(index)
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    session = SQLitePersistence.create_session(
+        3, today + timedelta(hours=11))
+    assert_matches_sessions(index)
+
+    session.end = today + timedelta(hours=12)
+    SQLitePersistence.update_session(session)
+    assert index.get_total_duration(
+        3, today + timedelta(hours=11, minutes=30),
+        today + timedelta(hours=12, minutes=15)) >= 30 * 60
+    assert_matches_sessions(index)
+
+    session.start -= timedelta(days=1)
+    SQLitePersistence.update_session(session)
+    assert_matches_sessions(index)
+
+    SQLitePersistence.delete_session(SQLitePersistence.get_session(1))
+    SQLitePersistence.create_sessions([
+        (2, today - timedelta(days=5, hours=i), today - timedelta(days=5))
+        for i in range(1, 4)])
+    assert_matches_sessions(index)
+
+    # Only the session version is read once a project is loaded
+    loaded = index._projects[2]
+    assert_matches_sessions(index)
+    assert index._projects[2] is loaded
+
+    index.detach()
+    assert not index._projects
+
+
+def test_interval_index_sees_sessions_written_elsewhere():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    index = IntervalIndex()
+    index.attach()
+    assert_matches_sessions(index)
+
+    # A connection of its own, like another process's
+    start = datetime.now() - timedelta(hours=3)
+    con = sqlite3.connect(SQLitePersistence._db_name)
+    con.execute(
+        "INSERT INTO sessions (start, end, project_id) VALUES (?, ?, 4);",
+        (to_timestamp(start), to_timestamp(start + timedelta(hours=1))))
+    con.execute("UPDATE session_version SET version = version + 1;")
+    con.commit()
+    con.close()
+
+    assert_matches_sessions(index)
+
+    # And keeps following this process's writes after reloading
+    SQLitePersistence.create_session(
+        4, start - timedelta(hours=2), start - timedelta(hours=1))
+    assert_matches_sessions(index)
+
+    index.detach()
+
+
+def test_loading_lets_sessions_be_written_meanwhile():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    index = IntervalIndex()
+    index.attach()
+
+    # Another thread writes once the project has been read
+    load = index._load
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    writer = threading.Thread(target=SQLitePersistence.create_session, args=(
+        2, today + timedelta(hours=1), today + timedelta(hours=2)))
+
+    def load_then_write(project_id):
+        result = load(project_id)
+        writer.start()
+        writer.join(5)
+        return result
+
+    index._load = load_then_write
+    index.get_total_durations(2, get_windows())
+    loaded = index._projects[2]
+    del index._load
+
+    # Not held up by the load, and replayed on top of it
+    assert not writer.is_alive()
+    assert_matches_sessions(index)
+    assert index._projects[2] is loaded
+
+    index.detach()
+
+
+def test_open_sessions_count_up_to_the_given_now():
+    init_sqlite()
+    init_projects()
+
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    SQLitePersistence.create_session(1, start)
+    windows = [("all", start - timedelta(days=1), start + timedelta(days=1))]
+
+    index = IntervalIndex()
+    totals = index.get_total_durations(
+        1, windows, to_timestamp(start) + 600)
+    assert totals["all"] == 600
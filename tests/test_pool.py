@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import threading
+import pytest
+from dtimetracker.persistence import SQLitePersistence
+from dtimetracker.pool import ConnectionPool
+from tests.test_sql_persistence import init_sqlite, init_projects
+
+
+def _in_thread(function):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(function).result()
+
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=4)
+
+    con = pool.get()
+    assert pool.get() is con
+
+    other_con = _in_thread(pool.get)
+    assert other_con is not con
+
+    pool.close_all()
+
+
+def test_connections_of_finished_threads_are_reused(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1)
+
+    first = _in_thread(pool.get)
+    second = _in_thread(pool.get)
+
+    assert first is second
+    assert pool.size() == 1
+
+    pool.close_all()
+
+
+def test_released_connections_are_reused(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1)
+
+    con = pool.get()
+    con.execute("CREATE TABLE t (x);")
+    con.execute("INSERT INTO t VALUES (1);")
+    pool.release()
+
+    # the uncommitted insert was rolled back on release
+    assert not con.in_transaction
+    assert pool.get() is con
+
+    pool.close_all()
+
+
+def test_pool_size_is_bounded(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1, timeout=0.1)
+    pool.get()
+
+    with pytest.raises(TimeoutError):
+        _in_thread(pool.get)
+
+    pool.close_all()
+
+
+def test_close_all_closes_every_connection(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=2)
+    connections = [pool.get()]
+
+    held = threading.Event()
+    done = threading.Event()
+
+    def hold_connection():
+        connections.append(pool.get())
+        held.set()
+        done.wait()
+
+    thread = threading.Thread(target=hold_connection)
+    thread.start()
+    held.wait()
+
+    pool.close_all()
+    done.set()
+    thread.join()
+
+    assert pool.size() == 0
+    for con in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            con.execute("SELECT 1;")
+
+
+def test_persistence_serves_concurrent_readers():
+    init_sqlite()
+    init_projects()
+
+    def read_projects(_):
+        names = SQLitePersistence.get_project_names()
+        SQLitePersistence.release_connection()
+        return names
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(read_projects, range(20)))
+
+    assert all(names == results[0] for names in results)
+    assert len(results[0]) == 5
+    assert SQLitePersistence._get_pool().size() <= 5
+
+    SQLitePersistence.delete_db()
+    assert SQLitePersistence._pool is None
@@ -0,0 +1,161 @@
+from datetime import datetime, date, time, timedelta
+from dtimetracker.persistence import SQLitePersistence
+from dtimetracker.reports import ReportEngine
+from tests.test_sql_persistence import init_sqlite, init_projects
+
+
+def init_report_sessions():
+    # Crosses midnight, Sunday Jan 30 -> Monday Jan 31 (new ISO week)
+    SQLitePersistence.create_session(
+        1, datetime(2022, 1, 30, 22, 0), datetime(2022, 1, 31, 1, 30))
+    # Crosses the month boundary, Jan 31 -> Feb 1
+    SQLitePersistence.create_session(
+        1, datetime(2022, 1, 31, 23, 0), datetime(2022, 2, 1, 2, 0))
+    SQLitePersistence.create_session(
+        1, datetime(2022, 2, 1, 9, 0), datetime(2022, 2, 1, 10, 15))
+    # Spans two full days
+    SQLitePersistence.create_session(
+        2, datetime(2022, 2, 1, 12, 0), datetime(2022, 2, 3, 12, 0))
+
+
+def test_daily_totals_split_sessions_at_midnight():
+    init_sqlite()
+    init_projects()
+    init_report_sessions()
+
+    rows = ReportEngine.get_daily_totals(date(2022, 1, 1), date(2022, 2, 28))
+
+    assert rows == [
+        (date(2022, 1, 30), 1, 2 * 3600),
+        (date(2022, 1, 31), 1, 90 * 60 + 3600),
+        (date(2022, 2, 1), 1, 2 * 3600 + 75 * 60),
+        (date(2022, 2, 1), 2, 12 * 3600),
+        (date(2022, 2, 2), 2, 24 * 3600),
+        (date(2022, 2, 3), 2, 12 * 3600),
+    ]
+
+
+def test_weekly_totals_use_iso_weeks():
+    init_sqlite()
+    init_projects()
+    init_report_sessions()
+
+    rows = ReportEngine.get_weekly_totals(
+        date(2022, 1, 1), date(2022, 2, 28), project_id=1)
+
+    assert rows == [
+        (date(2022, 1, 24), 1, 2 * 3600),
+        (date(2022, 1, 31), 1, 90 * 60 + 3600 + 2 * 3600 + 75 * 60),
+    ]
+    assert ReportEngine.get_period_label("week", rows[1][0]) == "2022-W05"
+
+
+def test_monthly_totals_split_sessions_at_month_boundary():
+    init_sqlite()
+    init_projects()
+    init_report_sessions()
+
+    rows = ReportEngine.get_monthly_totals(date(2022, 1, 1), date(2022, 2, 28))
+
+    assert rows == [
+        (date(2022, 1, 1), 1, 2 * 3600 + 90 * 60 + 3600),
+        (date(2022, 2, 1), 1, 2 * 3600 + 75 * 60),
+        (date(2022, 2, 1), 2, 48 * 3600),
+    ]
+    assert ReportEngine.sum_by_period(rows)[date(2022, 2, 1)] == (
+        2 * 3600 + 75 * 60 + 48 * 3600)
+
+
+def test_totals_are_clipped_to_the_range():
+    init_sqlite()
+    init_projects()
+    init_report_sessions()
+
+    rows = ReportEngine.get_daily_totals(date(2022, 2, 2), date(2022, 2, 2))
+
+    assert rows == [(date(2022, 2, 2), 2, 24 * 3600)]
+
+
+def _rollups():
+    con = SQLitePersistence._get_connection()
+    return con.execute(
+        "SELECT * FROM daily_totals ORDER BY project_id, day;").fetchall()
+
+
+def _rebuilt_rollups():
+    SQLitePersistence.rebuild_rollups()
+    return _rollups()
+
+
+def test_rollups_follow_session_writes():
+    init_sqlite()
+    init_projects()
+    init_report_sessions()
+
+    assert _rollups() == [
+        (1, "2022-01-30", 2 * 3600),
+        (1, "2022-01-31", 90 * 60 + 3600),
+        (1, "2022-02-01", 2 * 3600 + 75 * 60),
+        (2, "2022-02-01", 12 * 3600),
+        (2, "2022-02-02", 24 * 3600),
+        (2, "2022-02-03", 12 * 3600),
+    ]
+
+    s = SQLitePersistence.get_session(4)
+    s.project_id = 3
+    s.end = datetime(2022, 2, 5, 12, 0)
+    SQLitePersistence.update_session(s)
+    rollups = _rollups()
+    assert rollups == _rebuilt_rollups()
+    assert (3, "2022-02-05", 12 * 3600) in rollups
+    assert not [row for row in rollups if row[0] == 2]
+
+    SQLitePersistence.delete_session(SQLitePersistence.get_session(1))
+    rollups = _rollups()
+    assert rollups == _rebuilt_rollups()
+    assert (1, "2022-01-31", 3600) in rollups
+
+
+def test_rollups_ignore_open_sessions_until_stopped():
+    init_sqlite()
+    init_projects()
+
+    s = SQLitePersistence.create_session(1, datetime(2022, 2, 1, 9, 0))
+    assert _rollups() == []
+
+    s.end = datetime(2022, 2, 1, 10, 0)
+    SQLitePersistence.update_session(s)
+    assert _rollups() == [(1, "2022-02-01", 3600)]
+
+
+def test_rebuild_rollups_repairs_drift():
+    init_sqlite()
+    init_projects()
+    init_report_sessions()
+    expected = _rollups()
+
+    con = SQLitePersistence._get_connection()
+    con.execute("UPDATE daily_totals SET seconds = 1;")
+    con.execute("INSERT INTO daily_totals VALUES (5, '2022-01-01', 60);")
+    con.commit()
+
+    assert _rebuilt_rollups() == expected
+
+
+def test_reports_include_open_sessions_up_to_now():
+    init_sqlite()
+    init_projects()
+
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    midnight = datetime.combine(today, time())
+    SQLitePersistence.create_session(1, midnight - timedelta(hours=2))
+
+    before = int((datetime.now() - midnight).total_seconds())
+    rows = ReportEngine.get_daily_totals(yesterday, today)
+    after = int((datetime.now() - midnight).total_seconds())
+
+    assert rows[0] == (yesterday, 1, 2 * 3600)
+    if before > 0:
+        assert rows[1][:2] == (today, 1)
+        assert before <= rows[1][2] <= after
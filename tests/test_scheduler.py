@@ -0,0 +1,56 @@
+from dtimetracker.gui.scheduler import RefreshScheduler
+from tests.test_executor import FakeRoot
+
+
+def run_due(root):
+    """Runs the callbacks scheduled so far, but not those they schedule."""
+    for after_id in sorted(root.scheduled):
+        callback = root.scheduled.pop(after_id, None)
+        if callback is not None:
+            callback()
+
+
+def test_invalidations_in_one_tick_run_each_refresher_once():
+    root = FakeRoot()
+    scheduler = RefreshScheduler(root)
+    calls = []
+    scheduler.add_refresher("projects", lambda: calls.append("projects"))
+    scheduler.add_refresher("summaries", lambda: calls.append("summaries"))
+
+    scheduler.invalidate("summaries")
+    scheduler.invalidate("summaries")
+    scheduler.invalidate("projects", "summaries")
+    assert len(root.scheduled) == 1
+
+    run_due(root)
+    assert calls == ["projects", "summaries"]
+
+    # Nothing is queried again until something is invalidated
+    run_due(root)
+    assert calls == ["projects", "summaries"]
+
+    scheduler.invalidate()
+    run_due(root)
+    assert calls == ["projects", "summaries", "projects", "summaries"]
+
+
+def test_ticks_keep_running_until_stopped():
+    root = FakeRoot()
+    scheduler = RefreshScheduler(root)
+    ticks = []
+    scheduler.on_tick(lambda: ticks.append(1))
+    scheduler.add_refresher("summaries", lambda: None)
+
+    scheduler.start()
+    scheduler.start()
+    for _ in range(3):
+        run_due(root)
+    assert len(ticks) == 3
+    assert len(root.scheduled) == 1
+
+    scheduler.invalidate("summaries")
+    scheduler.stop()
+    assert not root.scheduled
+
+    run_due(root)
+    assert len(ticks) == 3
@@ -0,0 +1,206 @@
+from datetime import datetime, timedelta
+import os
+import sqlite3
+import threading
+from dtimetracker.core import Duration, to_timestamp
+from dtimetracker.persistence import SQLitePersistence
+from dtimetracker.snapshot import SessionSnapshot
+from tests.test_sql_persistence import (
+    init_sqlite, init_projects, init_sessions)
+
+
+def get_windows():
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("today", today, today + timedelta(days=1)),
+        ("yesterday", today - timedelta(days=1), today - timedelta(seconds=1)),
+        ("two weeks", today - timedelta(days=14), today + timedelta(days=1)),
+        ("all", datetime(2000, 1, 1), today + timedelta(days=2)),
+        ("none", datetime(2000, 1, 1), datetime(2000, 1, 2)),
+    ]
+
+
+def assert_matches_live(snapshot):
+    windows = get_windows()
+    for project_id in range(1, 6):
+        # Open sessions may grow by a second between the calls
+        before = SQLitePersistence.get_total_durations(project_id, windows)
+        snapped = snapshot.get_total_durations(project_id, windows)
+        after = SQLitePersistence.get_total_durations(project_id, windows)
+        for name, _, _ in windows:
+            assert before[name] <= snapped[name] <= after[name]
+            assert isinstance(snapped[name], Duration)
+
+
+def test_snapshot_matches_live_totals():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+    SQLitePersistence.archive_sessions(datetime.now() - timedelta(days=2))
+
+    snapshot = SessionSnapshot()
+    snapshot.build()
+    assert snapshot.is_current()
+    assert_matches_live(snapshot)
+
+    snapshot.close()
+
+
+def test_snapshot_follows_writes():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    snapshot = SessionSnapshot(max_segments=4)
+    snapshot.attach()
+
+    now = datetime.now().replace(microsecond=0)
+    session = SQLitePersistence.create_session(3, now - timedelta(hours=2))
+    assert_matches_live(snapshot)
+
+    session.stop()
+    SQLitePersistence.update_session(session)
+    assert_matches_live(snapshot)
+
+    session.start -= timedelta(days=1)
+    SQLitePersistence.update_session(session)
+    assert_matches_live(snapshot)
+
+    SQLitePersistence.delete_session(SQLitePersistence.get_session(1))
+    SQLitePersistence.create_sessions([
+        (2, now - timedelta(days=5, hours=i), now - timedelta(days=5))
+        for i in range(1, 4)])
+    assert_matches_live(snapshot)
+
+    # Segments were merged along the way
+    assert len(snapshot._segments) <= 4
+    assert snapshot.is_current()
+
+    snapshot.close()
+
+
+def test_snapshot_is_reused_until_the_database_changes():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    snapshot = SessionSnapshot()
+    snapshot.attach()
+    snapshot.close()
+
+    reopened = SessionSnapshot()
+    assert reopened.is_current()
+    paths = [segment.path for segment in reopened._segments]
+    assert_matches_live(reopened)
+    assert [segment.path for segment in reopened._segments] == paths
+
+    # Written while nobody was listening, so the snapshot is rebuilt
+    SQLitePersistence.create_session(
+        1, datetime.now() - timedelta(hours=3), datetime.now())
+    assert not reopened.is_current()
+    assert_matches_live(reopened)
+    assert reopened.is_current()
+
+    reopened.close()
+    SQLitePersistence.delete_db()
+
+
+def test_attached_snapshot_sees_sessions_written_elsewhere():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    snapshot = SessionSnapshot()
+    snapshot.attach()
+
+    # A connection of its own, like another process's
+    start = datetime.now() - timedelta(hours=3)
+    con = sqlite3.connect(SQLitePersistence._db_name)
+    con.execute(
+        "INSERT INTO sessions (start, end, project_id) VALUES (?, ?, 4);",
+        (to_timestamp(start), to_timestamp(start + timedelta(hours=1))))
+    con.execute("UPDATE session_version SET version = version + 1;")
+    con.commit()
+    con.close()
+
+    assert not snapshot.is_current()
+    assert_matches_live(snapshot)
+    assert snapshot.is_current()
+
+    # And keeps following this process's writes after the rebuild
+    SQLitePersistence.create_session(
+        4, start - timedelta(hours=2), start - timedelta(hours=1))
+    assert_matches_live(snapshot)
+
+    snapshot.close()
+
+
+def test_build_lets_sessions_be_written_meanwhile():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    snapshot = SessionSnapshot()
+    snapshot.attach()
+
+    # Another thread writes once the build has read the database
+    read_segments = snapshot._read_segments
+    writer = threading.Thread(target=SQLitePersistence.create_session, args=(
+        2, datetime.now() - timedelta(hours=2), datetime.now()))
+
+    def read_then_write():
+        result = read_segments()
+        writer.start()
+        writer.join(5)
+        return result
+
+    # As if the snapshot had missed writes
+    snapshot._version = None
+    snapshot._read_segments = read_then_write
+    snapshot.build()
+
+    # Not held up by the build, and replayed on top of it
+    assert not writer.is_alive()
+    assert snapshot.is_current()
+    assert_matches_live(snapshot)
+
+    snapshot.close()
+
+
+def test_writes_are_flushed_off_the_commit_path_in_tiers():
+    init_sqlite()
+    init_projects()
+    day = datetime(2022, 3, 1, 8)
+    SQLitePersistence.create_sessions(
+        [(1 + i % 5, day + timedelta(hours=i),
+          day + timedelta(hours=i, minutes=30))
+         for i in range(1000)])
+
+    # Only flushed when asked to
+    snapshot = SessionSnapshot(flush_delay=3600)
+    snapshot.attach()
+    base = snapshot._segments[0].path
+    files = os.listdir(snapshot.directory)
+
+    # Writes are answered from memory until they are flushed
+    SQLitePersistence.create_session(
+        2, day - timedelta(hours=1), day)
+    assert os.listdir(snapshot.directory) == files
+    assert_matches_live(snapshot)
+
+    for i in range(1, 40):
+        snapshot.flush()
+        SQLitePersistence.create_session(
+            2, day - timedelta(hours=i + 1), day - timedelta(hours=i))
+    snapshot.flush()
+
+    # The small segments merged with each other, not with the base
+    assert snapshot._segments[0].path == base
+    assert 1 < len(snapshot._segments) <= 4
+    assert_matches_live(snapshot)
+
+    snapshot.close()
+    reopened = SessionSnapshot()
+    assert reopened.is_current()
+    assert_matches_live(reopened)
+    reopened.close()
@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta, date
+import os
+import pytest
 from dtimetracker.persistence import SQLitePersistence
 from dtimetracker.core import Project, Session
 # from unittest.mock
@@ -141,6 +143,39 @@ def test_can_delete_project():
     assert SQLitePersistence.get_project(project.id) is None
 
 
+def test_deleting_a_project_deletes_its_sessions():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+    SQLitePersistence.archive_sessions(
+        datetime.now() - timedelta(days=2, hours=12))
+
+    changes = []
+    listener = lambda c, version: changes.extend(c)
+    SQLitePersistence.add_session_listener(listener)
+    try:
+        SQLitePersistence.delete_project(SQLitePersistence.get_project(2))
+    finally:
+        SQLitePersistence.remove_session_listener(listener)
+    assert [new for _, new in changes] == [None]
+
+    # The new project doesn't inherit the deleted one's sessions, not
+    # even archived ones
+    project = SQLitePersistence.create_project("F Project")
+    assert project.id == 6
+    start, end = datetime(2000, 1, 1), datetime.now() + timedelta(days=1)
+    assert SQLitePersistence.get_total_duration(project.id, start, end) == 0
+    assert SQLitePersistence.count_sessions() == 10
+
+    con = SQLitePersistence._get_connection()
+    assert con.execute(
+        "SELECT COUNT(*) FROM sessions WHERE project_id = 2;").fetchone() \
+        == (0,)
+    assert con.execute(
+        "SELECT COUNT(*) FROM daily_totals WHERE project_id = 2;"
+    ).fetchone() == (0,)
+
+
 # def test_can_create_sessions_with_correct_start_time():
     # init_sqlite()
     # init_projects()
@@ -166,6 +201,30 @@ def test_can_get_sessions():
     assert len(project0_sessions) == 2
 
 
+def test_can_get_sessions_as_batch():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    project = SQLitePersistence.get_projects()[0]
+    start = date.today() - timedelta(days=2)
+    end = datetime.now().replace(hour=23, minute=59, second=59)
+
+    batch = SQLitePersistence.get_sessions(
+        project.id, start, end, as_batch=True)
+    # Batches are streamed from the cursor and not cached
+    assert SQLitePersistence.get_cache_stats()["entries"] == 0
+    sessions = SQLitePersistence.get_sessions(project.id, start, end)
+
+    assert list(batch.ids) == [s.id for s in sessions]
+    assert set(batch.project_ids) == {project.id}
+
+    now = datetime.now().replace(microsecond=0)
+    expected = sum(
+        int(((s.end or now) - s.start).total_seconds()) for s in sessions)
+    assert abs(batch.total_duration() - expected) <= 1
+
+
 def test_get_session_returns_none():
     init_sqlite()
     init_projects()
@@ -253,3 +312,303 @@ def test_can_compute_total_session_duration():
 
     result = Session.compute_total_duration(sessions)
     assert result == (21, 21, 0)
+
+
+def _query_plan(call, *params):
+    """Runs a persistence call and explains the SELECT it sent to SQLite."""
+    con = SQLitePersistence._get_connection()
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        call(*params)
+    finally:
+        con.set_trace_callback(None)
+
+    query = [s for s in statements if "SELECT" in s][-1]
+    if "?" not in query:
+        # Python 3.11+ traces statements with the parameters expanded
+        params = ()
+
+    rows = con.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    return " ".join(row[3] for row in rows)
+
+
+def test_init_db_is_idempotent():
+    init_sqlite()
+    init_projects()
+    SQLitePersistence.init_db()
+
+    assert (SQLitePersistence._get_schema_version()
+            == len(SQLitePersistence._migrations))
+    assert len(SQLitePersistence.get_projects()) == 5
+
+
+def test_get_sessions_uses_index():
+    init_sqlite()
+    init_projects()
+
+    plan = _query_plan(
+        SQLitePersistence.get_sessions,
+        1, datetime(2022, 1, 1), datetime(2022, 1, 31, 23, 59, 59))
+
+    assert "USING COVERING INDEX sessions_project_start" in plan
+    assert "start>? AND start<?" in plan
+
+
+def test_get_open_session_uses_index():
+    init_sqlite()
+    init_projects()
+
+    plan = _query_plan(SQLitePersistence.get_open_session, 1)
+
+    assert "USING COVERING INDEX sessions_open" in plan
+
+
+def test_migrates_text_timestamps_to_integers():
+    SQLitePersistence.delete_db()
+    con = SQLitePersistence._get_connection()
+    con.execute("CREATE TABLE projects (id INTEGER PRIMARY KEY, name TEXT);")
+    con.execute("""
+        CREATE TABLE sessions (
+            id INTEGER PRIMARY KEY,
+            start TEXT NOT NULL,
+            end TEXT,
+            project_id INTEGER NOT NULL
+        );
+    """)
+    con.execute("INSERT INTO projects (name) VALUES ('A Project');")
+    con.execute("""
+        INSERT INTO sessions (start, end, project_id) VALUES
+        ('2022-03-01 08:00:00', '2022-03-01 12:30:15', 1),
+        ('2022-03-02 09:15:00', NULL, 1);
+    """)
+    con.commit()
+
+    SQLitePersistence.init_db()
+
+    closed = SQLitePersistence.get_session(1)
+    assert closed.start == datetime(2022, 3, 1, 8, 0, 0)
+    assert closed.end == datetime(2022, 3, 1, 12, 30, 15)
+
+    open_ = SQLitePersistence.get_open_session(1)
+    assert open_.id == 2
+    assert open_.start == datetime(2022, 3, 2, 9, 15, 0)
+
+    con = SQLitePersistence._get_connection()
+    types = con.execute(
+        "SELECT DISTINCT typeof(start) FROM sessions;").fetchall()
+    assert types == [("integer",)]
+
+
+def test_can_get_total_duration():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    start_date = datetime.now() - timedelta(days=30)
+    end_date = datetime.now().replace(hour=23, minute=59, second=59)
+
+    total = SQLitePersistence.get_total_duration(1, start_date, end_date)
+    assert total == 21 * 3600 + 21 * 60
+
+    assert SQLitePersistence.get_total_duration(3, start_date, end_date) == 0
+
+
+def test_total_duration_counts_open_sessions_until_now():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    midnight = datetime.now().replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    end_of_day = midnight.replace(hour=23, minute=59, second=59)
+
+    before = int((datetime.now() - midnight).total_seconds())
+    total = SQLitePersistence.get_total_duration(5, midnight, end_of_day)
+    after = int((datetime.now() - midnight).total_seconds())
+
+    assert before <= total <= after
+
+
+def test_can_get_total_durations_for_several_windows():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    windows = [
+        ("yesterday", today - timedelta(days=1), today - timedelta(seconds=1)),
+        ("last 2 weeks", today - timedelta(days=14), today),
+        ("last 30 days", today - timedelta(days=30), today),
+        ("empty", today - timedelta(days=100), today - timedelta(days=90)),
+    ]
+
+    totals = SQLitePersistence.get_total_durations(4, windows)
+
+    for name, from_, to in windows:
+        assert totals[name] == SQLitePersistence.get_total_duration(
+            4, from_, to)
+    assert totals["yesterday"] == 7 * 3600 + 40 * 60 + 10
+    assert str(totals["yesterday"]) == "07:40"
+    assert totals["empty"] == 0
+    assert SQLitePersistence.get_total_durations(4, []) == {}
+
+
+def test_can_create_sessions_in_bulk():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    start = datetime(2022, 1, 1, 8, 0, 0)
+
+    def generate_sessions():
+        for i in range(1000):
+            session_start = start + timedelta(hours=i)
+            yield (i % 3 + 1, session_start,
+                   session_start + timedelta(minutes=30))
+
+    ids = SQLitePersistence.create_sessions(generate_sessions())
+
+    assert list(ids) == list(range(13, 1013))
+    s = SQLitePersistence.get_session(ids[-1])
+    assert s.project_id == 999 % 3 + 1
+    assert s.start == start + timedelta(hours=999)
+    assert s.end == s.start + timedelta(minutes=30)
+
+    con = SQLitePersistence._get_connection()
+    rollups = con.execute("SELECT * FROM daily_totals ORDER BY 1, 2;")
+    rollups = rollups.fetchall()
+    SQLitePersistence.rebuild_rollups()
+    assert rollups == con.execute(
+        "SELECT * FROM daily_totals ORDER BY 1, 2;").fetchall()
+
+
+def test_create_sessions_can_read_back():
+    init_sqlite()
+    init_projects()
+
+    start = datetime(2022, 1, 1, 8, 0, 0)
+    sessions = SQLitePersistence.create_sessions(
+        [(1, start, None), (2, start, start + timedelta(hours=1))],
+        read_back=True)
+
+    assert [(s.id, s.project_id, s.end) for s in sessions] == [
+        (1, 1, None), (2, 2, start + timedelta(hours=1))]
+    assert not SQLitePersistence.create_sessions([])
+
+
+def _pragma(name):
+    con = SQLitePersistence._get_connection()
+    return con.execute(f"PRAGMA {name};").fetchone()[0]
+
+
+def test_connections_use_configured_pragmas():
+    init_sqlite()
+
+    assert _pragma("journal_mode") == "wal"
+    assert _pragma("synchronous") == 1
+    assert _pragma("temp_store") == 2
+    assert _pragma("busy_timeout") == 5000
+
+    SQLitePersistence.configure(profile="safe", cache_size=-8000)
+    assert _pragma("journal_mode") == "delete"
+    assert _pragma("synchronous") == 2
+    assert _pragma("cache_size") == -8000
+
+    SQLitePersistence.close()
+    assert _pragma("cache_size") == -8000
+
+    with pytest.raises(ValueError):
+        SQLitePersistence.configure(page_size=8192)
+
+    SQLitePersistence.configure()
+
+
+def test_init_db_keeps_the_configured_profile():
+    SQLitePersistence.configure(profile="safe")
+    init_sqlite()
+    assert _pragma("journal_mode") == "delete"
+    assert _pragma("synchronous") == 2
+
+    SQLitePersistence.init_db(profile="balanced")
+    assert _pragma("journal_mode") == "wal"
+
+
+def test_delete_db_removes_wal_files():
+    init_sqlite()
+    init_projects()
+
+    assert os.path.exists(SQLitePersistence._db_name + "-wal")
+
+    SQLitePersistence.delete_db()
+
+    for suffix in ("", "-wal", "-shm"):
+        assert not os.path.exists(SQLitePersistence._db_name + suffix)
+
+
+def test_can_page_through_sessions():
+    init_sqlite()
+    init_projects()
+
+    start = datetime(2022, 1, 1, 8, 0, 0)
+    # Pairs of sessions share a start, so pages must break ties by id
+    SQLitePersistence.create_sessions(
+        (1, start + timedelta(hours=i // 2), None) for i in range(25))
+    SQLitePersistence.create_sessions([(2, start, None)])
+
+    from_ = start
+    to = start + timedelta(days=1)
+
+    pages = []
+    page = SQLitePersistence.get_sessions_page(1, from_, to, limit=10)
+    while page:
+        pages.append(page)
+        page = SQLitePersistence.get_sessions_page(
+            1, from_, to, after=page[-1], limit=10)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    ids = [s.id for page in pages for s in page]
+    assert ids == list(range(1, 26))
+    assert ids == [s.id for s in SQLitePersistence.get_sessions(1, from_, to)]
+
+
+def test_iter_sessions_streams_in_batches():
+    init_sqlite()
+    init_projects()
+
+    start = datetime(2022, 1, 1, 8, 0, 0)
+    SQLitePersistence.create_sessions(
+        (1, start + timedelta(minutes=i), None) for i in range(1000))
+
+    sessions = SQLitePersistence.iter_sessions(
+        1, start + timedelta(minutes=100), start + timedelta(minutes=899),
+        batch_size=64)
+
+    assert [s.id for s in sessions] == list(range(101, 901))
+
+
+def test_get_sessions_page_uses_index():
+    init_sqlite()
+    init_projects()
+
+    plan = _query_plan(
+        SQLitePersistence.get_sessions_page,
+        1, datetime(2022, 1, 1), datetime(2022, 1, 31, 23, 59, 59),
+        Session(1, id=5, start=datetime(2022, 1, 10)), 10)
+
+    assert "USING COVERING INDEX sessions_project_start" in plan
+    assert "SCAN" not in plan
+
+
+def test_can_get_tracking_project_ids():
+    init_sqlite()
+    init_projects()
+    init_sessions()
+
+    assert SQLitePersistence.get_tracking_project_ids() == {5}
+
+    SQLitePersistence.create_session(2)
+    assert SQLitePersistence.get_tracking_project_ids() == {2, 5}
+
+    plan = _query_plan(SQLitePersistence.get_tracking_project_ids)
+    assert "USING COVERING INDEX sessions_open" in plan